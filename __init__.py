@@ -1,6 +1,13 @@
 # -*- coding: utf-8 -*-
 __version__ = "0.1.0"
 
+import os
+
+
+def _cache_dir():
+    ''' where the joslib caches live, JOSLIB_CACHE_DIR or ~/.cache/joslib, read on every call '''
+    return os.environ.get('JOSLIB_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'joslib')
+
 
 def my_jos_function_for_python_notebook():
     print("hello from __init__.py")
@@ -2,12 +2,19 @@
 from typing import List, Set, Dict, Tuple, Optional, ClassVar
 import apxapi
 from apxapi import APXAuthException
+from html.parser import HTMLParser
 import os
+from joslib import _cache_dir
+from joslib.streamsupport import fetch_streaming
 
 __version__ = "0.1.0"
-__all__ = ['login_apxapi', 'get_document_apo', 'get_document_pages_text',
-           'download_archived_document', 'download_pdf_doc', 'set_default_download_directory',
-           'get_default_download_directory']
+__all__ = ['login_apxapi', 'APXSessionManager', 'get_document_apo', 'get_document_pages_text', 'iter_documents_pages_text',
+           'PageTextCache',
+           'download_archived_document', 'download_pdf_doc', 'download_documents',
+           'set_default_download_directory',
+           'get_default_download_directory', 'get_document_org_id', 'prefetch_document_org_ids',
+           'enable_org_id_cache_persistence', 'org_id_cache_info', 'clear_org_id_cache', 'flush_org_id_cache',
+           'benchmark_page_text_extraction']
 
 def set_prod_data_orchestrator(do_host_and_port):
     apxapi.ENVMAP[apxapi.PRD]['dataorchestrator'] = do_host_and_port
@@ -28,6 +35,108 @@ def login_apxapi(username=None, password=None, environment=apxapi.PRD):
         return None
 
 
+class APXSessionManager(object):
+    """
+    one logged in APXSession shared by everything, threads included
+
+      manager = APXSessionManager(username, password)
+      download_documents(manager, doc_uuids, ...)
+
+    the manager stands in wherever a session is taken, attribute access goes to
+    the current session, which is logged in again token_ttl - refresh_margin seconds
+    after the last login so a long bulk run never hits an expired token. logins are
+    under a lock so many threads asking at once cause one login
+
+    every requests.Session we can find on the APXSession and its services gets a
+    single HTTPAdapter mounted, pool_maxsize keep-alive connections per host, and
+    the same adapter goes on the sessions made by a refresh, so the connections
+    (and their TLS handshakes) outlive the token
+
+    NOTE: pooling only works if apxapi keeps its requests.Session on the session or
+          on its service objects, pooled_sessions() tells you what we found
+    NOTE: the password is kept in memory for the refreshes, don't print the manager's
+          __dict__ in a notebook
+    """
+    def __init__(self, username:str=None, password:str=None, environment=apxapi.PRD, token_ttl:float=3600,
+                 refresh_margin:float=300, pool_maxsize:int=32, max_retries:int=0):
+        import threading
+        import requests.adapters
+
+        if not username:
+            username = input('Username: ')
+        if not password:
+            import getpass
+            password = getpass.getpass('Password: ')
+        self.username = username
+        self._password = password
+        self.environment = environment
+        self.token_ttl = token_ttl
+        self.refresh_margin = refresh_margin
+        self._adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=pool_maxsize,
+                                                      max_retries=max_retries)
+        self._lock = threading.RLock()
+        self._session = None
+        self._logged_in_at = None
+        self._pooled = []
+        self.logins = 0
+
+    def _login(self):
+        import time
+        session = apxapi.APXSession(username=self.username, password=self._password, environment=self.environment)
+        self._pooled = self._mount_adapter(session)
+        self._session = session
+        self._logged_in_at = time.monotonic()
+        self.logins += 1
+
+    def _mount_adapter(self, session) -> List[str]:
+        import requests
+        pooled = []
+        for owner_name, owner in [('session', session)] + list(vars(session).items()):
+            for name, value in vars(owner).items() if hasattr(owner, '__dict__') else ():
+                if isinstance(value, requests.Session):
+                    value.mount('https://', self._adapter)
+                    value.mount('http://', self._adapter)
+                    pooled.append(f"{owner_name}.{name}")
+        return pooled
+
+    def session(self):
+        """ the current APXSession, logging in first if there isn't one or it is about to expire """
+        import time
+        with self._lock:
+            if self._session is None or \
+                    time.monotonic() - self._logged_in_at >= self.token_ttl - self.refresh_margin:
+                self._login()
+            return self._session
+
+    def refresh(self) -> None:
+        """ log in again now, for when the server has told you the token is no good """
+        with self._lock:
+            self._login()
+
+    def pooled_sessions(self) -> List[str]:
+        """ the requests.Sessions that got the pooled adapter, by attribute name """
+        self.session()
+        return list(self._pooled)
+
+    def close(self) -> None:
+        """ drop the session and close the pooled connections """
+        with self._lock:
+            self._session = None
+            self._adapter.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getattr__(self, name):
+        # only called for attributes the manager doesn't have, i.e. the session's
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.session(), name)
+
+
 def get_document_apo(doc_uuid:str):
     """
     doc_uuid - document to pull APO for
@@ -43,7 +152,8 @@ def get_document_apo(doc_uuid:str):
     except:
         return {}
 
-def get_document_pages_text(apx_session:apxapi.APXSession, doc_uuid:str, pages:List[int]=None, keep_line_breaks=True, include_raw_text:bool=False) -> List[Dict]:
+def get_document_pages_text(apx_session:apxapi.APXSession, doc_uuid:str, pages:List[int]=None, keep_line_breaks=True, include_raw_text:bool=False,
+                            cache:'PageTextCache'=None) -> List[Dict]:
     """usage: get_document_pages_text(session, doc_uuid)
     usage: get_document_pages_text(session, doc_uuid, [2, 5, 8]) 
 
@@ -55,6 +165,8 @@ def get_document_pages_text(apx_session:apxapi.APXSession, doc_uuid:str, pages:L
     keep_line_breaks - if true, will preserve ocr_lines, otherwise \n will 
       be converted to space char
     inclue_raw_text - provide text w/ HTML markup (can be very verbose)
+    cache    - a PageTextCache, documents you have pulled before come from the
+      encrypted local copy instead of the dataorchestrator. no cache, no local copy
 
     currrently we only support the extracted_text type which is the text that
     the Tesseract OCR module delivers. there is an option here to ask for the
@@ -79,53 +191,608 @@ def get_document_pages_text(apx_session:apxapi.APXSession, doc_uuid:str, pages:L
           text in the ipynb file
 
     """
+    if cache is not None:
+        page_recs = cache.get(doc_uuid, keep_line_breaks, include_raw_text)
+        if page_recs is not None:
+            return _select_pages(page_recs, pages)
+
+    document_xml = _fetch_document_xml(apx_session, doc_uuid)
+    if document_xml is None:
+        return
+
+    if cache is None:
+        return _extract_pages_text(document_xml, pages, keep_line_breaks, include_raw_text)
+
+    # cache the whole document so any later set of pages is a hit
+    page_recs = _extract_pages_text(document_xml, None, keep_line_breaks, include_raw_text)
+    cache.put(doc_uuid, keep_line_breaks, include_raw_text, page_recs)
+    return _select_pages(page_recs, pages)
+
+
+class _OcrLineScanner(HTMLParser):
+    """
+    pulls the text of each ocr_line span out of hOCR without building a tree,
+    the text is everything inside the span (the ocrx_word spans included) the
+    same as BeautifulSoup's span.text
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines = []
+        self._depth = 0     # how many spans deep we are inside an ocr_line, 0 outside
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'span':
+            return
+        if self._depth:
+            self._depth += 1
+            return
+        for name, value in attrs:
+            if name == 'class' and value and 'ocr_line' in value.split():
+                self._depth = 1
+                self._text = []
+                return
+
+    def handle_endtag(self, tag):
+        if tag == 'span' and self._depth:
+            self._depth -= 1
+            if not self._depth:
+                self.lines.append(''.join(self._text))
+
+    def handle_data(self, data):
+        if self._depth:
+            self._text.append(data)
+
+
+def _ocr_lines_scanner(html:str) -> List[str]:
+    scanner = _OcrLineScanner()
+    scanner.feed(html)
+    scanner.close()
+    return scanner.lines
+
+
+def _ocr_lines_lxml(html:str) -> List[str]:
+    import lxml.html
+    root = lxml.html.fromstring(html)
+    return [''.join(span.itertext()) for span in root.iter('span')
+            if 'ocr_line' in (span.get('class') or '').split()]
+
+
+def _ocr_lines_bs4(html:str) -> List[str]:
+    # the original way, kept for comparison in benchmark_page_text_extraction()
     from bs4 import BeautifulSoup
-    import xml.etree.cElementTree as ET
+    soup = BeautifulSoup(html, 'html.parser')
+    return [s.text for s in soup.find_all('span', class_='ocr_line')]
+
+
+def _ocr_lines_engine(engine:str='auto'):
+    if engine == 'auto':
+        try:
+            import lxml.html
+            return _ocr_lines_lxml
+        except ImportError:
+            return _ocr_lines_scanner
+    return {'lxml': _ocr_lines_lxml, 'scanner': _ocr_lines_scanner, 'bs4': _ocr_lines_bs4}[engine]
+
+
+def _page_text(html:str, ocr_lines, keep_line_breaks:bool) -> str:
+    # pages with no ocr_line spans at all don't need parsing
+    text_lines = [line.replace('\n', ' ') for line in ocr_lines(html)] if 'ocr_line' in html else []
+    return '\n'.join(text_lines) if keep_line_breaks else ' '.join(text_lines)
+
+
+def _extract_pages_text(document_xml:str, pages:List[int]=None, keep_line_breaks:bool=True,
+                        include_raw_text:bool=False, engine:str='auto') -> List[Dict]:
+    """
+    the parsing half of get_document_pages_text(), document_xml is the stringContent
+    of the document APO
+
+    the xml is walked with iterparse and each page is thrown away once we are done
+    with it, pages not asked for are skipped before any of their html is parsed
+
+    engine - how to find the ocr_line spans: 'lxml', 'scanner' (a stdlib
+      HTMLParser that doesn't build a tree), 'bs4' (the old way), 'auto' is lxml
+      when it is installed and the scanner otherwise
+    """
+    import io
+    import xml.etree.ElementTree as ET
+
+    ocr_lines = _ocr_lines_engine(engine)
+    wanted = set(pages) if pages else None
+    document_text:List[Dict] = []
+    path = []
+    for event, elem in ET.iterparse(io.BytesIO(document_xml.encode('utf-8')), events=('start', 'end')):
+        if event == 'start':
+            path.append(elem.tag)
+            continue
+        path.pop()
+        # only root/pages/page, same as iterfind('pages/page') on the root
+        if elem.tag != 'page' or path[1:] != ['pages']:
+            continue
+
+        # NOTE: the classes in the xml library have a very funky deal going on, if you cast 
+        # an instance to bool, it will return false, definitely forcing an explicit comparison
+        if len(elem):
+            pn = elem.find('pageNumber')
+            if wanted is None or int(pn.text) in wanted:
+                pt = elem.find('plainText')
+                et = elem.find('extractedText/content')
+                it = elem.find('imgType')
+
+                page_rec = {'page_number': pn.text, 'image_type': it.text, 'plain_text': None, 'extracted_text': None}
+
+                # plainText is a key we added if we had extracted text from PDF if it contained text
+                if pt is not None and pt.text:
+                    if include_raw_text:
+                        page_rec['plain_text_w_markup'] = pt.text
+                    # assumption here is plain_text is in html form...
+                    page_rec['plain_text'] = _page_text(pt.text, ocr_lines, keep_line_breaks)
 
+                if et is not None and et.text:
+                    if include_raw_text:
+                        page_rec['extracted_text_w_markup'] = et.text
+                    page_rec['extracted_text'] = _page_text(et.text, ocr_lines, keep_line_breaks)
+
+                document_text.append(page_rec)
+        elem.clear()
+
+    return document_text
+
+
+def _fetch_document_xml(apx_session, doc_uuid:str) -> Optional[str]:
     r = apx_session.dataorchestrator.patient_object_by_doc(doc_uuid)
     if not r.status_code == 200:
         print(f"Unable to fetch doc: {doc_uuid}, status_code: {r.status_code}")
-        return
-  
-    j = r.json()
-    document_text:List({}) = []
-    xdoc = ET.fromstring(j['documents'][0]['stringContent'].encode('utf-8'))
-
-    # NOTE: the classes in the xml library have a very funky deal going on, if you cast 
-    # an instance to bool, it will return false, definitely forcing an explicit comparison
-    for page in xdoc.iterfind('pages/page'):
-        if page:
-            pt = page.find('plainText')
-            pn = page.find('pageNumber')
-            et = page.find('extractedText/content')
-            it = page.find('imgType')
-
-            if pages and int(pn.text) not in pages:
+        return None
+    return r.json()['documents'][0]['stringContent']
+
+
+def _select_pages(page_recs:List[Dict], pages:List[int]=None) -> List[Dict]:
+    if not pages:
+        return page_recs
+    wanted = set(pages)
+    return [rec for rec in page_recs if int(rec['page_number']) in wanted]
+
+
+def iter_documents_pages_text(apx_session, doc_uuids:List[str], pages:List[int]=None, keep_line_breaks:bool=True,
+                              include_raw_text:bool=False, fetch_workers:int=4, parse_workers:int=None,
+                              max_in_flight:int=16, cache:'PageTextCache'=None):
+    """usage: for doc_uuid, page_recs in iter_documents_pages_text(session, doc_uuids): ...
+
+    get_document_pages_text() for many documents. documents are fetched on a pool of
+    fetch_workers threads while the hOCR parsing runs on a pool of parse_workers
+    processes (None for one per core), so the network and the cpu work overlap
+
+    yields (doc_uuid, page records) as each document finishes, not in doc_uuids
+    order. page records are None when the document could not be fetched
+
+    max_in_flight - most documents fetched or being fetched but not yet handed back
+      to you, this is what bounds memory. if you are slow consuming, fetching waits
+    cache - a PageTextCache, documents found there are yielded without a fetch
+
+    NOTE: Users! same as get_document_pages_text(), this text is sensitive, keep it
+          in memory and don't leave it printed in your notebook
+    """
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+    doc_uuids = iter(doc_uuids)
+    in_flight = 0
+    running = {}    # future -> (stage, doc_uuid)
+    with ThreadPoolExecutor(max_workers=fetch_workers) as fetchers, \
+            ProcessPoolExecutor(max_workers=parse_workers) as parsers:
+        while True:
+            while in_flight < max_in_flight:
+                doc_uuid = next(doc_uuids, None)
+                if doc_uuid is None:
+                    break
+                if cache is not None:
+                    page_recs = cache.get(doc_uuid, keep_line_breaks, include_raw_text)
+                    if page_recs is not None:
+                        yield doc_uuid, _select_pages(page_recs, pages)
+                        continue
+                running[fetchers.submit(_fetch_document_xml, apx_session, doc_uuid)] = ('fetch', doc_uuid)
+                in_flight += 1
+            if not running:
+                return
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, doc_uuid = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Unable to {stage} doc: {doc_uuid}, {type(e).__name__}: {e}")
+                    result = None
+                if stage == 'fetch' and result is not None:
+                    running[parsers.submit(_extract_pages_text, result, None if cache is not None else pages,
+                                           keep_line_breaks, include_raw_text)] = ('parse', doc_uuid)
+                    continue
+                if stage == 'parse' and result is not None and cache is not None:
+                    cache.put(doc_uuid, keep_line_breaks, include_raw_text, result)
+                    result = _select_pages(result, pages)
+                in_flight -= 1
+                yield doc_uuid, result
+
+
+class PageTextCache(object):
+    """
+    local cache of get_document_pages_text() results so re-running a notebook
+    doesn't re-fetch and re-parse the same documents
+
+      cache = PageTextCache(key=my_key)
+      get_document_pages_text(session, doc_uuid, cache=cache)
+
+    every entry is encrypted with Fernet (pip install cryptography) under key, and
+    the file names are hashes so not even the doc uuids are readable on disk. one
+    entry per doc_uuid + keep_line_breaks + include_raw_text, holding all the pages
+
+    key       - Fernet key, PageTextCache.generate_key() makes one. defaults to the
+      JOSLIB_PAGE_CACHE_KEY environment variable. keep it out of your notebook
+    cache_dir - defaults to page_text under JOSLIB_CACHE_DIR or ~/.cache/joslib
+    ttl       - seconds an entry is good for, None for no expiry
+    max_bytes - once the entries add up to more than this the least recently used
+      ones are removed
+
+    NOTE: this is still patient text, just encrypted. purge() when you are done
+          with the documents
+    """
+    def __init__(self, key=None, cache_dir:str=None, ttl:Optional[float]=7 * 24 * 3600,
+                 max_bytes:int=1 << 30):
+        import threading
+        try:
+            from cryptography.fernet import Fernet
+        except ImportError:
+            raise ImportError("PageTextCache needs the cryptography package, pip install cryptography")
+
+        key = key or os.environ.get('JOSLIB_PAGE_CACHE_KEY')
+        if not key:
+            raise ValueError("PageTextCache: no key, pass key= or set JOSLIB_PAGE_CACHE_KEY, "
+                             "PageTextCache.generate_key() will make you one")
+        if cache_dir is None:
+            cache_dir = os.path.join(_cache_dir(), 'page_text')
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+
+        self._fernet = Fernet(key)
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._bytes = sum(os.path.getsize(f) for f in self._entry_files())
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @staticmethod
+    def generate_key() -> bytes:
+        from cryptography.fernet import Fernet
+        return Fernet.generate_key()
+
+    def _entry_files(self) -> List[str]:
+        return [e.path for e in os.scandir(self.cache_dir) if e.is_file() and e.name.endswith('.page_text')]
+
+    def _file_name(self, doc_uuid:str, keep_line_breaks:bool, include_raw_text:bool) -> str:
+        import hashlib
+        key = f"{doc_uuid}|{bool(keep_line_breaks)}|{bool(include_raw_text)}"
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.page_text')
+
+    def _remove(self, file_name:str) -> None:
+        try:
+            size = os.path.getsize(file_name)
+            os.remove(file_name)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._bytes -= size
+
+    def get(self, doc_uuid:str, keep_line_breaks:bool=True, include_raw_text:bool=False) -> Optional[List[Dict]]:
+        """ the cached page records, None when we don't have them or they have expired """
+        import json
+        from cryptography.fernet import InvalidToken
+
+        file_name = self._file_name(doc_uuid, keep_line_breaks, include_raw_text)
+        try:
+            with open(file_name, 'rb') as f:
+                token = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            # the token carries its creation time, Fernet does the ttl check for us
+            page_recs = json.loads(self._fernet.decrypt(token, ttl=None if self.ttl is None else int(self.ttl)))
+        except InvalidToken:
+            # expired, or written under another key, either way it is no use to us
+            self._remove(file_name)
+            with self._lock:
+                self.misses += 1
+                self.expired += 1
+            return None
+        # mtime is the recently used clock for eviction
+        os.utime(file_name)
+        with self._lock:
+            self.hits += 1
+        return page_recs
+
+    def put(self, doc_uuid:str, keep_line_breaks:bool, include_raw_text:bool, page_recs:List[Dict]) -> None:
+        import json
+        import tempfile
+
+        file_name = self._file_name(doc_uuid, keep_line_breaks, include_raw_text)
+        token = self._fernet.encrypt(json.dumps(page_recs).encode('utf-8'))
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(token)
+            old_size = os.path.getsize(file_name) if os.path.exists(file_name) else 0
+            os.replace(tmp_name, file_name)
+        except BaseException:
+            os.remove(tmp_name)
+            raise
+        with self._lock:
+            self._bytes += len(token) - old_size
+            over = self._bytes > self.max_bytes
+        if over:
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for file_name in self._entry_files():
+            try:
+                st = os.stat(file_name)
+            except FileNotFoundError:
                 continue
+            entries.append((st.st_mtime, st.st_size, file_name))
+        entries.sort()
+        with self._lock:
+            self._bytes = sum(size for _, size, _ in entries)
+        # oldest first, but never the entry we just wrote
+        for _, _, file_name in entries[:-1]:
+            if self._bytes <= self.max_bytes:
+                break
+            self._remove(file_name)
+            with self._lock:
+                self.evicted += 1
 
-            page_rec = {'page_number': pn.text, 'image_type': it.text, 'plain_text': None, 'extracted_text': None}
-
-            # plainText is a key we added if we had extracted text from PDF if it contained text
-            if pt is not None and pt.text:
-                if include_raw_text:
-                    page_rec['plain_text_w_markup'] = pt.text
-                # assumption here is plain_text is in html form...
-                soup = BeautifulSoup(pt.text, 'html.parser')
-                spans = soup.find_all('span', class_='ocr_line')
-                text_lines = [s.text.replace('\n', ' ') for s in spans]
-                page_rec['plain_text'] = '\n'.join(text_lines) if keep_line_breaks else ' '.join(text_lines)
-
-            if et is not None and et.text:
-                if include_raw_text:
-                    page_rec['extracted_text_w_markup'] = et.text
-                soup = BeautifulSoup(et.text, 'html.parser')
-                spans = soup.find_all('span', class_='ocr_line')
-                text_lines = [s.text.replace('\n', ' ') for s in spans]
-                page_rec['extracted_text'] = '\n'.join(text_lines) if keep_line_breaks else ' '.join(text_lines)
-
-            document_text.append(page_rec)
-            
-    return document_text
+    def purge(self, doc_uuid:str=None) -> int:
+        """
+        delete cached text, all of it or just one document's. returns the number
+        of entries removed
+        """
+        if doc_uuid is None:
+            file_names = self._entry_files()
+        else:
+            file_names = [self._file_name(doc_uuid, klb, irt) for klb in (True, False) for irt in (True, False)]
+            file_names = [f for f in file_names if os.path.exists(f)]
+        for file_name in file_names:
+            self._remove(file_name)
+        return len(file_names)
+
+    def info(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                    'expired': self.expired, 'evicted': self.evicted, 'bytes': self._bytes,
+                    'max_bytes': self.max_bytes, 'ttl': self.ttl}
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = self.misses = self.expired = self.evicted = 0
+
+
+def _synthetic_document_xml(n_pages:int, lines_per_page:int) -> str:
+    from xml.sax.saxutils import escape
+    def hocr(page):
+        lines = ''.join(
+            "<span class='ocr_line' id='line_{0}_{1}' title='bbox 10 20 30 40'>\n"
+            "<span class='ocrx_word' id='word_{0}_{1}_1'>Patient</span> "
+            "<span class='ocrx_word' id='word_{0}_{1}_2'>seen &amp; examined</span> "
+            "<span class='ocrx_word' id='word_{0}_{1}_3'>on 10/{1}/2019</span>\n</span>".format(page, line)
+            for line in range(lines_per_page))
+        return "<div class='ocr_page'><p class='ocr_par'>{}</p></div>".format(lines)
+    pages = ''.join(
+        "<page><pageNumber>{0}</pageNumber><imgType>TIFF</imgType>"
+        "<extractedText><content>{1}</content></extractedText></page>".format(p, escape(hocr(p)))
+        for p in range(1, n_pages + 1))
+    return "<document><pages>{}</pages></document>".format(pages)
+
+
+def benchmark_page_text_extraction(n_pages:int=200, lines_per_page:int=50, engines:List[str]=None) -> Dict[str, float]:
+    """
+    benchmark, pages/sec extracting text from a synthetic hOCR document for each
+    engine of _extract_pages_text() that can run here. 'bs4' is how
+    get_document_pages_text() used to do it
+    """
+    import time
+    document_xml = _synthetic_document_xml(n_pages, lines_per_page)
+    results = {}
+    expected = None
+    for engine in engines or ['bs4', 'scanner', 'lxml']:
+        try:
+            start = time.perf_counter()
+            pages = _extract_pages_text(document_xml, engine=engine)
+            results[engine] = n_pages / (time.perf_counter() - start)
+        except ImportError:
+            continue
+        if expected is None:
+            expected = pages
+        elif pages != expected:
+            print(f"{engine} text differs from {list(results)[0]}")
+        print(f"{engine:>8}: {results[engine]:,.0f} pages/sec")
+    return results
+
+
+## doc_uuid -> org id cache, shared by everything in this process that downloads
+## documents. in memory LRU, optionally backed by a SQLite file so the next
+## session starts warm. keyed by environment since uuids are only unique per environment,
+## sessions with no environment are only cached in memory.
+## SQLite writes are buffered and committed batch_size at a time under their own
+## lock, so lookups from other threads never wait on a commit
+class _OrgIdCache(object):
+    def __init__(self, maxsize=100000, batch_size=500):
+        import threading
+        from collections import OrderedDict
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+
+    def enable_persistence(self, db_file):
+        import atexit
+        import sqlite3
+        self.close()
+        os.makedirs(os.path.dirname(db_file) or '.', exist_ok=True)
+        db = sqlite3.connect(db_file, check_same_thread=False)
+        db.execute("CREATE TABLE IF NOT EXISTS org_ids (environment TEXT, doc_uuid TEXT, org_id TEXT, "
+                   "PRIMARY KEY (environment, doc_uuid))")
+        db.commit()
+        with self._db_lock:
+            self._db = db
+        atexit.unregister(self.close)
+        atexit.register(self.close)
+
+    def get(self, environment, doc_uuid):
+        key = (environment, doc_uuid)
+        with self._lock:
+            org_id = self._entries.get(key) or self._pending.get(key)
+        if org_id is None and environment is not None:
+            with self._db_lock:
+                if self._db is not None:
+                    row = self._db.execute("SELECT org_id FROM org_ids WHERE environment = ? AND doc_uuid = ?",
+                                           key).fetchone()
+                    if row:
+                        org_id = row[0]
+        with self._lock:
+            if org_id is None:
+                self.misses += 1
+            else:
+                self._remember(key, org_id)
+                self.hits += 1
+        return org_id
+
+    def put(self, environment, doc_uuid, org_id):
+        key = (environment, doc_uuid)
+        with self._lock:
+            self._remember(key, org_id)
+            if self._db is None or environment is None:
+                return
+            self._pending[key] = org_id
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """ write the buffered entries to the SQLite file, one commit """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        with self._db_lock:
+            if self._db is not None:
+                self._db.executemany("INSERT OR REPLACE INTO org_ids VALUES (?, ?, ?)",
+                                     [key + (org_id,) for key, org_id in pending.items()])
+                self._db.commit()
+
+    def close(self):
+        """ flush and let go of the SQLite file, the in memory entries stay """
+        self.flush()
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _remember(self, key, org_id):
+        self._entries[key] = org_id
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries),
+                    'maxsize': self.maxsize, 'persistent': self._db is not None,
+                    'unsaved': len(self._pending)}
+
+
+_org_id_cache = _OrgIdCache()
+
+def _session_environment(session):
+    # None when the session doesn't say, those org ids are only cached in memory since
+    # the same uuid can mean a different document in another environment
+    environment = getattr(session, 'environment', None)
+    return None if environment is None else str(environment)
+
+
+def get_document_org_id(session, doc_uuid:str) -> str:
+    """
+    org id of a document, from the process wide cache when we have looked it up before
+
+    raises if the dataorchestrator doesn't answer 200, nothing is cached then
+    """
+    environment = _session_environment(session)
+    org_id = _org_id_cache.get(environment, doc_uuid)
+    if org_id is None:
+        r = session.dataorchestrator.document_org_id(doc_uuid)
+        if r.status_code != 200:
+            raise Exception("org id lookup for doc {} failed, got {}".format(doc_uuid, r.status_code))
+        org_id = r.text
+        _org_id_cache.put(environment, doc_uuid, org_id)
+    return org_id
+
+
+def prefetch_document_org_ids(session, doc_uuids:List[str], max_workers:int=8) -> Dict[str, str]:
+    """
+    look up the org ids of many documents in parallel and leave them in the cache,
+    the ones we already have cost nothing. returns doc_uuid -> org id, None for
+    the documents whose lookup failed
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def lookup(doc_uuid):
+        try:
+            return get_document_org_id(session, doc_uuid)
+        except Exception as e:
+            print(e)
+            return None
+
+    doc_uuids = list(doc_uuids)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        org_ids = dict(zip(doc_uuids, pool.map(lookup, doc_uuids)))
+    _org_id_cache.flush()
+    return org_ids
+
+
+def enable_org_id_cache_persistence(db_file:str=None) -> None:
+    """
+    back the org id cache with a SQLite file, by default under JOSLIB_CACHE_DIR or ~/.cache/joslib
+    """
+    if db_file is None:
+        db_file = os.path.join(_cache_dir(), 'org_ids.sqlite')
+    _org_id_cache.enable_persistence(db_file)
+
+
+def org_id_cache_info() -> Dict:
+    return _org_id_cache.info()
+
+
+def clear_org_id_cache() -> None:
+    """ empty the in memory cache, a persistent file is left alone """
+    _org_id_cache.clear()
+
+
+def flush_org_id_cache() -> None:
+    """ write org ids still buffered in memory to the persistent file, also done at exit """
+    _org_id_cache.flush()
 
 
 _download_dir = "/Users/jschneider/Downloads/"
@@ -140,20 +807,56 @@ def get_default_download_directory():
     return _download_dir
 
 
-def _write_file(file_name, file_content, download_dir):
-    if _download_dir not in file_name:
-        file_name = download_dir + file_name
-    # make sure directory path exists
-    file_dir = os.path.dirname(file_name)
-    if not os.path.exists(file_dir):
-        os.makedirs(file_dir)
-    # write the file
-    f = open(file_name, 'wb')
-    f.write(file_content)
-    f.close()
+_download_chunk_size = 1 << 20
+
+def _stream_to_file(response, file_name, download_dir, chunk_size=_download_chunk_size, progress=False):
+    """
+    write a response body to file_name chunk_size bytes at a time, into a temp file
+    in the same directory that is renamed into place when complete, so there is never
+    a half written file under the real name and memory use stays at one chunk
+
+    progress - print bytes and bytes/sec as we go
+
+    returns the number of bytes written
+    """
+    import tempfile
+    import time
+
+    # callers hand us paths already joined onto download_dir, only bare names get it added
+    if not file_name.startswith(download_dir):
+        file_name = os.path.join(download_dir, file_name)
+    file_dir = os.path.dirname(file_name) or '.'
+    os.makedirs(file_dir, exist_ok=True)
+
+    start = last_report = time.monotonic()
+    written = 0
+    fd, tmp_name = tempfile.mkstemp(dir=file_dir, prefix='.' + os.path.basename(file_name), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if not chunk:
+                    continue
+                f.write(chunk)
+                written += len(chunk)
+                now = time.monotonic()
+                if progress and now - last_report >= 1.0:
+                    print("  {:,} bytes, {:,.0f} bytes/sec".format(written, written / (now - start)))
+                    last_report = now
+        os.replace(tmp_name, file_name)
+    except BaseException:
+        os.remove(tmp_name)
+        raise
+    finally:
+        response.close()
+
+    if progress:
+        elapsed = max(time.monotonic() - start, 1e-6)
+        print("wrote {:,} bytes in {:.1f}s, {:,.0f} bytes/sec".format(written, elapsed, written / elapsed))
+    return written
 
 
-def download_archived_document(session, doc_uuid, output_file_name=None, download_dir=_download_dir, org_id=None):
+def download_archived_document(session, doc_uuid, output_file_name=None, download_dir=None, org_id=None,
+                               chunk_size=_download_chunk_size, progress=False):
     """
     take a document UUID and download the associate PDF to the download_dir
     NOTE: you are only using this to access and stage a PDF for use meaning you
@@ -167,12 +870,16 @@ def download_archived_document(session, doc_uuid, output_file_name=None, downloa
     download_dir - you need to provide this or set it using the set_default_download_directory()
              call
 
+    chunk_size - the file is streamed to disk this many bytes at a time
+    progress - print bytes and bytes/sec while downloading
+
     NOTE: you are only using this to access and stage a PDF for use meaning you
           will be re-encrypting it, OR you are using it to diagnose an issue with
           the system and will be deleting the document right after
     """
+    download_dir = download_dir or get_default_download_directory()
     if org_id is None:
-        org_id = session.dataorchestrator.document_org_id(doc_uuid).text
+        org_id = get_document_org_id(session, doc_uuid)
 
     if not output_file_name:
         output_file_name = "{}_{}.arcfile".format(doc_uuid, org_id)
@@ -180,15 +887,18 @@ def download_archived_document(session, doc_uuid, output_file_name=None, downloa
     filepath = os.path.join(download_dir, output_file_name)
     print("Fetching into {}".format(filepath))
 
-    r = session.dataorchestrator.get_archive_document(org_id, doc_uuid)
+    r = fetch_streaming(session.dataorchestrator.get_archive_document, org_id, doc_uuid)
     if r.status_code == 200:
         print("got file writing now")
-        _write_file(filepath, r.content, download_dir)
+        _stream_to_file(r, filepath, download_dir, chunk_size, progress)
     else:
+        # a streamed response holds its pooled connection until it is closed
+        r.close()
         print("Fetch failed, got {}".format(r.status_code))
 
 
-def download_pdf_doc(s, doc_uuid:str, org=None, download_dir:str=_download_dir):
+def download_pdf_doc(s, doc_uuid:str, org=None, download_dir:str=None,
+                     chunk_size:int=_download_chunk_size, progress:bool=False):
     """
     take a document UUID and download the associate PDF to the download_dir
     NOTE: you are only using this to access and stage a PDF for use meaning you
@@ -202,21 +912,318 @@ def download_pdf_doc(s, doc_uuid:str, org=None, download_dir:str=_download_dir):
     download_dir - you need to provide this or set it using the set_default_download_directory()
              call
 
+    chunk_size - the file is streamed to disk this many bytes at a time
+    progress - print bytes and bytes/sec while downloading
+
     NOTE: you are only using this to access and stage a PDF for use meaning you
           will be re-encrypting it, OR you are using it to diagnose an issue with
           the system and will be deleting the document right after
     """
+    download_dir = download_dir or get_default_download_directory()
     if org is None:
-        org = s.dataorchestrator.document_org_id(doc_uuid).text
+        org = get_document_org_id(s, doc_uuid)
     
     filepath = os.path.join(download_dir,"{}_{}.pdf".format(org, doc_uuid))
     print("Fetching into {}".format(filepath))
 
-    r = s.dataorchestrator.file(doc_uuid)
+    r = fetch_streaming(s.dataorchestrator.file, doc_uuid)
     if r.status_code == 200:
         print("got file writing now")
-        _write_file(filepath, r.content, download_dir)
+        _stream_to_file(r, filepath, download_dir, chunk_size, progress)
     else:
+        # a streamed response holds its pooled connection until it is closed
+        r.close()
         print("Fetch failed, got {}".format(r.status_code))
 
 
+# how each kind of download is fetched and named: dataorchestrator method, its args
+# from (org, doc_uuid), and the file name template
+_download_kinds = {
+    'pdf': ('file', lambda org, doc_uuid: (doc_uuid,), "{org}_{doc}.pdf"),
+    'archive': ('get_archive_document', lambda org, doc_uuid: (org, doc_uuid), "{doc}_{org}.arcfile"),
+}
+
+def _downloaded_doc_uuids(download_dir:str, name_template:str) -> Set[str]:
+    """
+    doc uuids of the files in download_dir named by name_template, from one directory
+    listing. uuids have no underscores so the doc part can't run into the org part
+    """
+    import re
+    pattern = re.compile(re.escape(name_template).replace(r'\{org\}', '.*').replace(r'\{doc\}', '(?P<doc>[^_]+)') + '$')
+    try:
+        names = os.listdir(download_dir)
+    except FileNotFoundError:
+        return set()
+    return {m.group('doc') for m in map(pattern.match, names) if m}
+
+
+def download_documents(session, doc_uuids:List[str], download_dir:str=None, kind:str='pdf',
+                       max_workers:int=8, max_per_host:int=4, retries:int=3, backoff:float=1.0,
+                       skip_existing:bool=True, chunk_size:int=_download_chunk_size) -> Dict:
+    """
+    download many documents at once, download_pdf_doc (kind='pdf') or
+    download_archived_document (kind='archive') over a thread pool
+
+    download_dir  - None for the set_default_download_directory() one, as it is when called
+    max_workers   - download threads
+    max_per_host  - most requests we have open against the dataorchestrator at once,
+      org lookups and file fetches both count
+    retries       - extra attempts for a document after an exception, a 5xx or a 429,
+      waiting backoff, 2*backoff, 4*backoff... seconds between them
+    skip_existing - don't fetch documents that already have a file in download_dir
+
+    returns a summary dict, succeeded / skipped doc lists, failed doc -> reason,
+    bytes, seconds, docs_per_sec and bytes_per_sec
+
+    NOTE: same as download_pdf_doc, you are only using this to access and stage PDFs
+          for use meaning you will be re-encrypting them, OR you are using them to
+          diagnose an issue with the system and will be deleting them right after
+    """
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    download_dir = download_dir or get_default_download_directory()
+    if kind not in _download_kinds:
+        raise ValueError(f"download_documents: kind must be one of {list(_download_kinds)}, got {kind}")
+    method, fetch_args, name_template = _download_kinds[kind]
+    host_limit = threading.BoundedSemaphore(max_per_host)
+
+    have = _downloaded_doc_uuids(download_dir, name_template) if skip_existing else set()
+
+    def download_one(doc_uuid):
+        if doc_uuid in have:
+            return doc_uuid, 'skipped', 0
+        org = None
+        reason = None
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(backoff * 2 ** (attempt - 1))
+            try:
+                with host_limit:
+                    if org is None:
+                        org = get_document_org_id(session, doc_uuid)
+                    # looked up every attempt, an APXSessionManager may have logged in again since
+                    r = fetch_streaming(getattr(session.dataorchestrator, method), *fetch_args(org, doc_uuid))
+                    if r.status_code == 200:
+                        filepath = os.path.join(download_dir, name_template.format(org=org, doc=doc_uuid))
+                        return doc_uuid, 'succeeded', _stream_to_file(r, filepath, download_dir, chunk_size)
+                    r.close()
+                    reason = f"status {r.status_code}"
+                    if r.status_code < 500 and r.status_code != 429:
+                        break
+            except Exception as e:
+                reason = f"{type(e).__name__}: {e}"
+        return doc_uuid, 'failed', reason
+
+    start = time.monotonic()
+    summary = {'succeeded': [], 'skipped': [], 'failed': {}, 'bytes': 0}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for doc_uuid, outcome, detail in pool.map(download_one, doc_uuids):
+            if outcome == 'failed':
+                summary['failed'][doc_uuid] = detail
+            else:
+                summary[outcome].append(doc_uuid)
+                summary['bytes'] += detail
+
+    elapsed = max(time.monotonic() - start, 1e-6)
+    summary['seconds'] = elapsed
+    summary['docs_per_sec'] = len(summary['succeeded']) / elapsed
+    summary['bytes_per_sec'] = summary['bytes'] / elapsed
+    print("downloaded {} ({:,} bytes), skipped {}, failed {} in {:.1f}s, {:.1f} docs/sec, {:,.0f} bytes/sec".format(
+        len(summary['succeeded']), summary['bytes'], len(summary['skipped']), len(summary['failed']),
+        elapsed, summary['docs_per_sec'], summary['bytes_per_sec']))
+    return summary
+
+
+import unittest
+class TestDownloadDocuments(unittest.TestCase):
+    """ download_documents against a fake dataorchestrator, no network """
+
+    class _Response(object):
+        def __init__(self, status_code, body=b'', text=''):
+            self.status_code = status_code
+            self.body = body
+            self.text = text
+            self.closed = False
+
+        def iter_content(self, chunk_size):
+            yield self.body
+
+        def close(self):
+            self.closed = True
+
+    def _fake_apxsession(self, refresh_after):
+        # each login's token dies at the next login, the manager logs in again
+        # in the middle of the refresh_after'th file fetch
+        test = self
+        logins = []
+        fetches = []
+
+        class DataOrchestrator(object):
+            def __init__(self, login):
+                self.login = login
+
+            def document_org_id(self, doc_uuid):
+                return test._Response(200, text='org1')
+
+            def file(self, doc_uuid, stream=False):
+                if self.login != len(logins):
+                    return test._Response(401)
+                fetches.append(doc_uuid)
+                if len(fetches) == refresh_after:
+                    test.manager.refresh()
+                return test._Response(200, body=doc_uuid.encode())
+
+        class APXSession(object):
+            def __init__(self, username=None, password=None, environment=None):
+                logins.append(self)
+                self.dataorchestrator = DataOrchestrator(len(logins))
+
+        return APXSession, logins
+
+    def test_manager_refresh_midway(self):
+        import contextlib
+        import io
+        import tempfile
+        from unittest import mock
+
+        APXSession, logins = self._fake_apxsession(refresh_after=5)
+        doc_uuids = [f'd{i}' for i in range(20)]
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.object(apxapi, 'APXSession', APXSession), \
+                contextlib.redirect_stdout(io.StringIO()):
+            self.manager = APXSessionManager('user', 'password', environment='test')
+            summary = download_documents(self.manager, doc_uuids, download_dir=tmp, max_workers=2, backoff=0)
+            self.assertEqual(sorted(os.listdir(tmp)), sorted(f'org1_{d}.pdf' for d in doc_uuids))
+        self.assertEqual(summary['failed'], {})
+        self.assertEqual(sorted(summary['succeeded']), sorted(doc_uuids))
+        self.assertEqual(len(logins), 2)
+
+    def _org_failing_session(self, failures):
+        # the org lookup answers 500 with an html body failures times per document
+        test = self
+
+        class DataOrchestrator(object):
+            def __init__(self):
+                self.org_lookups = {}
+
+            def document_org_id(self, doc_uuid):
+                self.org_lookups[doc_uuid] = self.org_lookups.get(doc_uuid, 0) + 1
+                if self.org_lookups[doc_uuid] <= failures:
+                    return test._Response(500, text='<html>oops</html>')
+                return test._Response(200, text='org1')
+
+            def file(self, doc_uuid, stream=False):
+                return test._Response(200, body=doc_uuid.encode())
+
+        class Session(object):
+            environment = 'test'
+            dataorchestrator = DataOrchestrator()
+        return Session()
+
+    def test_org_lookup_error_is_retried_not_cached(self):
+        import contextlib
+        import io
+        import tempfile
+
+        clear_org_id_cache()
+        session = self._org_failing_session(failures=1)
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+            summary = download_documents(session, ['org-retry'], download_dir=tmp, backoff=0)
+            self.assertEqual(os.listdir(tmp), ['org1_org-retry.pdf'])
+        self.assertEqual(summary['succeeded'], ['org-retry'])
+        self.assertEqual(session.dataorchestrator.org_lookups['org-retry'], 2)
+        self.assertEqual(get_document_org_id(session, 'org-retry'), 'org1')
+
+    def test_org_lookup_error_fails_the_document(self):
+        import contextlib
+        import io
+        import tempfile
+
+        clear_org_id_cache()
+        session = self._org_failing_session(failures=10)
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+            summary = download_documents(session, ['org-gone'], download_dir=tmp, retries=2, backoff=0)
+            self.assertEqual(os.listdir(tmp), [])
+        self.assertEqual(list(summary['failed']), ['org-gone'])
+        self.assertEqual(summary['succeeded'], [])
+        with self.assertRaises(Exception):
+            get_document_org_id(session, 'org-gone')
+
+    def test_no_environment_is_not_persisted(self):
+        import sqlite3
+        import tempfile
+
+        cache = _OrgIdCache()
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = os.path.join(tmp, 'org_ids.sqlite')
+            cache.enable_persistence(db_file)
+            cache.put(None, 'doc-a', 'org1')
+            cache.put('test', 'doc-b', 'org2')
+            cache.close()
+            self.assertEqual(cache.get(None, 'doc-a'), 'org1')
+            rows = sqlite3.connect(db_file).execute("SELECT * FROM org_ids").fetchall()
+        self.assertEqual(rows, [('test', 'doc-b', 'org2')])
+
+    def test_failed_responses_are_closed(self):
+        import contextlib
+        import io
+        import tempfile
+
+        test = self
+        responses = []
+
+        class DataOrchestrator(object):
+            def document_org_id(self, doc_uuid):
+                return test._Response(200, text='org1')
+
+            def _fetch(self, status_code):
+                responses.append(test._Response(status_code))
+                return responses[-1]
+
+            def file(self, doc_uuid, stream=False):
+                return self._fetch(503 if doc_uuid == 'busy' else 404)
+
+            def get_archive_document(self, org, doc_uuid, stream=False):
+                return self._fetch(500)
+
+        class Session(object):
+            environment = 'test'
+            dataorchestrator = DataOrchestrator()
+
+        clear_org_id_cache()
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+            summary = download_documents(Session(), ['busy', 'gone'], download_dir=tmp, retries=2, backoff=0)
+            download_pdf_doc(Session(), 'gone', download_dir=tmp)
+            download_archived_document(Session(), 'gone', download_dir=tmp)
+        self.assertEqual(sorted(summary['failed']), ['busy', 'gone'])
+        # busy is tried three times, gone once, then the two single document helpers
+        self.assertEqual(len(responses), 6)
+        self.assertTrue(all(r.closed for r in responses))
+
+    def test_default_download_directory_is_read_per_call(self):
+        import contextlib
+        import io
+        import tempfile
+        from unittest import mock
+
+        test = self
+
+        class DataOrchestrator(object):
+            def document_org_id(self, doc_uuid):
+                return test._Response(200, text='org1')
+
+            def file(self, doc_uuid, stream=False):
+                return test._Response(200, body=doc_uuid.encode())
+
+        class Session(object):
+            environment = 'test'
+            dataorchestrator = DataOrchestrator()
+
+        # the patch puts the module default back however the test ends
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()), \
+                mock.patch(f'{__name__}._download_dir', _download_dir):
+            set_default_download_directory(tmp)
+            download_documents(Session(), ['later'])
+            download_pdf_doc(Session(), 'single')
+            self.assertEqual(sorted(os.listdir(tmp)), ['org1_later.pdf', 'org1_single.pdf'])
@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 from typing import List, Set, Dict, Tuple, Optional, ClassVar
 from dateutil.parser import parse as parse_date
-from datetime import datetime
+from datetime import datetime, date
+from functools import lru_cache
 
 __version__ = "0.1.0"
-__all__ = ['create_hive_date_range_filter', 'check_file_writable']
+__all__ = ['create_hive_date_range_filter', 'create_hive_multi_range_filter', 'create_hive_date_range_filters',
+           'merge_date_ranges', 'hive_partition_specs', 'benchmark_hive_filters',
+           'hive_filter_cache_info', 'hive_filter_cache_clear', 'check_file_writable', 'check_files_writable',
+           'check_files_writable_cache_clear']
 
 """
 requires python 3.4? and above - uses types and "f" strings
@@ -31,7 +35,102 @@ def check_file_writable(fnm):
     return os.access(pdir, os.W_OK)
 
 
-def create_hive_date_range_filter(start_date:str, end_date:str) -> str:
+## directories seen writable, shared by check_files_writable() calls. a directory
+## found writable once isn't access() checked again, clear the cache if permissions
+## change under you. we still look that it exists, a deleted one drops out. unwritable
+## or missing ones are looked at again every time
+_writable_dirs:Dict[str, bool] = {}
+# with more paths than this in one directory, list it once instead of a stat per path
+_scandir_threshold = 64
+
+
+def check_files_writable_cache_clear() -> None:
+    _writable_dirs.clear()
+
+
+def _check_directory(pdir:str, names:List[str], create_dirs:bool) -> List[bool]:
+    """
+    check_file_writable() for every names[i] in pdir, with pdir looked at once.
+    same answers as check_file_writable(), a symlink counts as its target so a
+    broken one is a path we can create
+    """
+    import os
+    writable = False
+    if pdir in _writable_dirs:
+        writable = os.path.isdir(pdir)
+        if not writable:
+            _writable_dirs.pop(pdir, None)
+    if not writable:
+        if create_dirs and not os.path.exists(pdir):
+            try:
+                os.makedirs(pdir, exist_ok=True)
+            except OSError:
+                pass
+        writable = os.path.isdir(pdir) and os.access(pdir, os.W_OK)
+        if writable:
+            _writable_dirs[pdir] = True
+    if not writable and not os.path.isdir(pdir):
+        # no directory, nothing in it exists and nothing can be created
+        return [False] * len(names)
+
+    if len(names) > _scandir_threshold:
+        with os.scandir(pdir) as entries:
+            existing = {e.name: e for e in entries}
+        is_file = lambda name: existing[name].is_file()
+        # like os.path.exists, a symlink only exists if its target does
+        exists = lambda name: name in existing and (not existing[name].is_symlink() or
+                                                    os.path.exists(existing[name].path))
+    else:
+        is_file = lambda name: os.path.isfile(os.path.join(pdir, name))
+        exists = lambda name: os.path.exists(os.path.join(pdir, name))
+
+    verdicts = []
+    for name in names:
+        if not exists(name):
+            verdicts.append(writable)
+        elif is_file(name):
+            # an existing file needs its own permissions checked
+            verdicts.append(os.access(os.path.join(pdir, name), os.W_OK))
+        else:
+            verdicts.append(False)
+    return verdicts
+
+
+def check_files_writable(paths:List[str], create_dirs:bool=False, max_workers:int=16) -> List[bool]:
+    """
+    check_file_writable() for many paths at once, e.g. before writing a csv per patient
+
+    paths are grouped by directory and each directory is checked once, on a pool of
+    max_workers threads since on a network filesystem every check is a round trip.
+    directory verdicts are cached between calls, see check_files_writable_cache_clear()
+
+    create_dirs - make missing directories instead of reporting their paths unwritable
+
+    returns a bool per path, in the order given
+    """
+    import os
+    from collections import defaultdict
+    from concurrent.futures import ThreadPoolExecutor
+
+    paths = list(paths)
+    by_dir = defaultdict(list)
+    for i, path in enumerate(paths):
+        pdir, name = os.path.split(path)
+        by_dir[pdir or '.'].append((i, name))
+
+    verdicts = [False] * len(paths)
+    def check(item):
+        pdir, entries = item
+        return entries, _check_directory(pdir, [name for _, name in entries], create_dirs)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for entries, dir_verdicts in pool.map(check, by_dir.items()):
+            for (i, _), verdict in zip(entries, dir_verdicts):
+                verdicts[i] = verdict
+    return verdicts
+
+
+def create_hive_date_range_filter(start_date:str, end_date:str, planner:bool=False) -> str:
     """
     create a hive filter for a date range at the day level
     cases are
@@ -41,12 +140,45 @@ def create_hive_date_range_filter(start_date:str, end_date:str) -> str:
     4) span a month boundary over a year boundary
     5) span multiple month boundaries where one is a year boundary
     6) span multiple year bounaries
+
+    planner - the shortest equivalent predicate instead, see create_hive_multi_range_filter()
+
+    filters are memoized on the dates, not the strings, so "1/3/2020" and "2020-01-03"
+    share an entry, see hive_filter_cache_info()
     """
-    if parse_date(end_date) < parse_date(start_date):
+    sd = _parse_date_cached(start_date) if isinstance(start_date, str) else start_date
+    ed = _parse_date_cached(end_date) if isinstance(end_date, str) else end_date
+    if ed < sd:
         raise Exception(f"create_hive_date_range: illegal date range {start_date}, {end_date}")
-    
-    days_in_month = {1: 31, 2: 28, 3: 31, 4: 30, 5: 31, 6: 30, 
-                     7: 31, 8: 31, 9: 30, 10: 31, 11: 30, 12: 31}
+    return _cached_date_range_filter(_day_number(sd), _day_number(ed), planner)
+
+
+_epoch_ordinal = date(1970, 1, 1).toordinal()
+_hive_filter_cache_size = 4096
+
+def _day_number(d) -> int:
+    # days since 1970-01-01, same numbering as datetime64[D]
+    return d.toordinal() - _epoch_ordinal
+
+
+@lru_cache(maxsize=65536)
+def _parse_date_cached(date_str:str) -> datetime:
+    return parse_date(date_str)
+
+
+@lru_cache(maxsize=_hive_filter_cache_size)
+def _cached_date_range_filter(start_day:int, end_day:int, planner:bool) -> str:
+    if planner:
+        return _cached_ranges_filter(((start_day, end_day),), True)
+    return _date_range_filter(date.fromordinal(start_day + _epoch_ordinal),
+                              date.fromordinal(end_day + _epoch_ordinal))
+
+
+def _date_range_filter(sd:date, ed:date) -> str:
+    """ the body of create_hive_date_range_filter(), dates already parsed and checked """
+    def days_in_month(date:datetime) -> int:
+        return _calendar_index(_day_number(date)).month_length_of(_day_number(date))
+
     def get_days_in_month(date:datetime, days:str) -> List[str]:
         """
         date - date with month from which to get days for, days are returned as a list of strings
@@ -54,21 +186,19 @@ def create_hive_date_range_filter(start_date:str, end_date:str) -> str:
         upto_days - if 'from_beginning', then return from beginning of month '01' upto and including the day, 
           if 'to_end' then return from from that day to end of month 
           
-        see days_in_month map for the lenght of each month
-
-        TODO: jos, need dynamic update for leap years
+        see days_in_month for the lenght of each month, leap years included
         """
         day = int(date.day)
         if days == 'from_beginning':
             return [day for day in range(1, day + 1)]
         elif days == 'to_end':
-            return [day for day in range(day, days_in_month[date.month] + 1)]
+            return [day for day in range(day, days_in_month(date) + 1)]
         else:
             raise Exception("upto_days must be either 'from_beginning' or 'to_end'")
 
 
     def is_last_day_in_month(date:datetime) -> bool:
-        return date.day == days_in_month[date.month]
+        return date.day == days_in_month(date)
 
     
     def get_days_between_two_days(start_day:int, end_day:int):
@@ -113,8 +243,6 @@ def create_hive_date_range_filter(start_date:str, end_date:str) -> str:
 
         return f"(year = '{year:02}'{month_clause}{day_clause})"
 
-    sd = parse_date(start_date)
-    ed = parse_date(end_date)        
     clauses = []
     accumulated_months = []
     for year in range(sd.year, ed.year + 1):
@@ -169,7 +297,436 @@ def create_hive_date_range_filter(start_date:str, end_date:str) -> str:
     return f"({or_str.join(clauses)})"
 
 
+## many date ranges at once. dates become numpy datetime64[D] day numbers so the
+## calendar arithmetic (month lengths, leap years) is numpy's, and the covered days
+## are worked out for all ranges together
+
+class _CalendarIndex(object):
+    """
+    day number (days since 1970-01-01) -> year, month, day, month key and month length,
+    and month key -> first day number and length, as arrays built once for a span of
+    whole years, so cutting ranges up by month is a gather instead of datetime
+    arithmetic. leap years come from numpy's calendar
+    """
+    def __init__(self, first_year:int=1900, last_year:int=2100):
+        import numpy as np
+        days = np.arange(np.datetime64(f'{first_year:04}-01-01'), np.datetime64(f'{last_year + 1:04}-01-01'))
+        months = days.astype('datetime64[M]')
+        month_firsts = months.astype('datetime64[D]')
+        self.first_year = first_year
+        self.last_year = last_year
+        self.first = int(days[0].astype(np.int64))
+        self.last = int(days[-1].astype(np.int64))
+        self.year = (days.astype('datetime64[Y]').astype(np.int64) + 1970).astype(np.int32)
+        self.month_key = months.astype(np.int64).astype(np.int32)   # months since 1970-01
+        self.month = (self.month_key % 12 + 1).astype(np.int8)
+        self.day = ((days - month_firsts).astype(np.int64) + 1).astype(np.int8)
+        self.month_length = ((months + 1).astype('datetime64[D]') - month_firsts).astype(np.int64).astype(np.int8)
+        # by month, index with month key - first_month
+        self.first_month = int(self.month_key[0])
+        self.month_start = np.flatnonzero(self.day == 1) + self.first
+        self.month_days = self.month_length[self.month_start - self.first].astype(np.int64)
+        self._month_days = self.month_days.tolist()
+
+    def covers(self, lo:int, hi:int) -> bool:
+        return self.first <= lo and hi <= self.last
+
+    def month_length_of(self, day:int) -> int:
+        return int(self.month_length[day - self.first])
+
+    def days_in_month(self, year:int, month:int) -> int:
+        return self._month_days[(year - 1970) * 12 + month - 1 - self.first_month]
+
+
+_calendar = None
+
+def _calendar_index(lo:int, hi:int=None) -> _CalendarIndex:
+    """ the shared calendar index, rebuilt wider if lo..hi (day numbers) falls outside it """
+    global _calendar
+    hi = lo if hi is None else hi
+    if _calendar is None or not _calendar.covers(lo, hi):
+        first_year = date.fromordinal(max(lo + _epoch_ordinal, 1)).year
+        last_year = date.fromordinal(min(hi + _epoch_ordinal, date.max.toordinal())).year
+        if _calendar is not None:
+            first_year = min(first_year, _calendar.first_year)
+            last_year = max(last_year, _calendar.last_year)
+        _calendar = _CalendarIndex(min(first_year, 1900), max(last_year, 2100))
+    return _calendar
+
+
+def _as_days(dates) -> 'np.ndarray':
+    """
+    dates as a datetime64[D] array, dates can be datetime64, date/datetime objects
+    or strings dateutil can parse. each distinct string is only parsed once
+    """
+    import numpy as np
+    dates = np.asarray(dates)
+    if np.issubdtype(dates.dtype, np.datetime64):
+        return dates.astype('datetime64[D]')
+    if dates.size == 0:
+        return dates.astype('datetime64[D]')
+    values, inverse = np.unique(dates, return_inverse=True)
+    parsed = np.array([_parse_date_cached(v) if isinstance(v, str) else v for v in values], dtype='datetime64[D]')
+    return parsed[inverse.reshape(dates.shape)]
+
+
+def merge_date_ranges(start_dates, end_dates) -> Tuple['np.ndarray', 'np.ndarray']:
+    """
+    merge (start, end) date ranges, both ends inclusive, into the fewest ranges
+    covering the same days. ranges that overlap or touch (one ends the day before
+    the next starts) become one
+
+    returns sorted datetime64[D] arrays of starts and ends
+    """
+    import numpy as np
+    starts = _as_days(start_dates).ravel()
+    ends = _as_days(end_dates).ravel()
+    if starts.shape != ends.shape:
+        raise Exception(f"merge_date_ranges: {starts.size} start dates but {ends.size} end dates")
+    bad = ends < starts
+    if bad.any():
+        i = int(np.flatnonzero(bad)[0])
+        raise Exception(f"merge_date_ranges: illegal date range {starts[i]}, {ends[i]}")
+    if starts.size == 0:
+        return starts, ends
+
+    order = np.argsort(starts, kind='stable')
+    s = starts[order].astype(np.int64)
+    reach = np.maximum.accumulate(ends[order].astype(np.int64))
+    # a new range starts wherever there is a gap after everything before it
+    new = s[1:] > reach[:-1] + 1
+    merged_starts = s[np.concatenate(([True], new))]
+    merged_ends = reach[np.concatenate((new, [True]))]
+    return merged_starts.astype('datetime64[D]'), merged_ends.astype('datetime64[D]')
+
+
+def _month_segments(starts:'np.ndarray', ends:'np.ndarray'):
+    """
+    disjoint sorted ranges (int64 day numbers) cut at month boundaries, one segment
+    per range per month it touches. returns per segment year, month, first and last
+    day of the month covered, and whether that is the whole month
+
+    works month by month, the days in between are never expanded
+    """
+    import numpy as np
+    cal = _calendar_index(int(starts[0]), int(ends[-1]))
+    first_months = cal.month_key[starts - cal.first].astype(np.int64)
+    last_months = cal.month_key[ends - cal.first].astype(np.int64)
+    n_months = last_months - first_months + 1
+    seg_range = np.repeat(np.arange(len(starts)), n_months)
+    seg_month = np.repeat(first_months, n_months) + (np.arange(n_months.sum()) - np.repeat(np.cumsum(n_months) - n_months, n_months))
+    month_start = cal.month_start[seg_month - cal.first_month]
+    month_days = cal.month_days[seg_month - cal.first_month]
+    lo = np.maximum(starts[seg_range], month_start) - month_start + 1
+    hi = np.minimum(ends[seg_range], month_start + month_days - 1) - month_start + 1
+    full = (lo == 1) & (hi == month_days)
+    return seg_month // 12 + 1970, seg_month % 12 + 1, lo, hi, full
+
+
+def _month_coverage(starts:'np.ndarray', ends:'np.ndarray'):
+    """
+    disjoint sorted ranges (int64 day numbers) split up by month. returns years, month
+    numbers, whether the month is covered in full, and each month's covered day numbers
+    """
+    import numpy as np
+    seg_years, seg_months, lo, hi, seg_full = _month_segments(starts, ends)
+    month_key = seg_years * 12 + seg_months
+    month_starts = np.flatnonzero(np.concatenate(([True], month_key[1:] != month_key[:-1])))
+    bounds = np.concatenate((month_starts, [len(month_key)]))
+    # a month split over two ranges has a gap in it, so neither segment is full
+    full = seg_full[month_starts]
+    day_nums = [np.concatenate([np.arange(lo[j], hi[j] + 1) for j in range(bounds[i], bounds[i + 1])])
+                for i in range(len(month_starts))]
+    return seg_years[month_starts], seg_months[month_starts], full, day_nums
+
+
+def _partition_clauses(starts:'np.ndarray', ends:'np.ndarray') -> List[str]:
+    """
+    hive clauses selecting exactly the year/month/day partitions of disjoint sorted
+    ranges. whole years are a year clause, whole months in a year one month clause,
+    the rest list their days
+    """
+    import numpy as np
+    years, month_nums, full, day_nums = _month_coverage(starts, ends)
+    clauses = []
+    for year in np.unique(years):
+        in_year = np.flatnonzero(years == year)
+        if len(in_year) == 12 and full[in_year].all():
+            clauses.append(f"(year = '{year:02}')")
+            continue
+        full_months = [int(month_nums[i]) for i in in_year if full[i]]
+        for i in in_year:
+            if full[i]:
+                if month_nums[i] != full_months[0]:
+                    continue
+                if len(full_months) == 1:
+                    clauses.append(f"(year = '{year:02}' and month = '{full_months[0]:02}')")
+                else:
+                    clauses.append(f"(year = '{year:02}' and month in ({str([f'{m:02}' for m in full_months])[1:-1]}))")
+            else:
+                clauses.append(f"(year = '{year:02}' and month = '{month_nums[i]:02}' "
+                               f"and day in ({str([f'{d:02}' for d in day_nums[i]])[1:-1]}))")
+    return clauses
+
+
+def _range_runs(start_day:int, end_day:int) -> List[Tuple]:
+    """
+    the planner's view of one range of day numbers, the fewest runs of whole years,
+    whole months within a year and days within a month that cover it, in order
+
+      ('years', first, last)
+      ('months', year, first, last)
+      ('days', year, month, first, last)
+
+    plain arithmetic on the range ends, nothing in between is visited
+    """
+    cal = _calendar_index(start_day, end_day)
+    sd = date.fromordinal(start_day + _epoch_ordinal)
+    ed = date.fromordinal(end_day + _epoch_ordinal)
+    runs = []
+
+    def whole_months(year, first, last):
+        if first == 1 and last == 12:
+            if runs and runs[-1][0] == 'years' and runs[-1][2] == year - 1:
+                runs[-1] = ('years', runs[-1][1], year)
+            else:
+                runs.append(('years', year, year))
+        else:
+            runs.append(('months', year, first, last))
+
+    year, month = sd.year, sd.month
+    if (year, month) == (ed.year, ed.month):
+        if sd.day == 1 and ed.day == cal.days_in_month(year, month):
+            whole_months(year, month, month)
+        else:
+            runs.append(('days', year, month, sd.day, ed.day))
+        return runs
+
+    if sd.day != 1:
+        runs.append(('days', year, month, sd.day, cal.days_in_month(year, month)))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    # whole months run up to the end month, or the one before it when that is cut short
+    last_year, last_month = ed.year, ed.month
+    end_is_whole = ed.day == cal.days_in_month(last_year, last_month)
+    if not end_is_whole:
+        last_year, last_month = (last_year - 1, 12) if last_month == 1 else (last_year, last_month - 1)
+    while (year, month) <= (last_year, last_month):
+        through = last_month if year == last_year else 12
+        whole_months(year, month, through)
+        year, month = year + 1, 1
+
+    if not end_is_whole:
+        runs.append(('days', ed.year, ed.month, 1, ed.day))
+    return runs
+
+
+def _eq_or_between(column:str, first:int, last:int) -> str:
+    # partition values are zero padded strings so between compares them in calendar order
+    if first == last:
+        return f"{column} = '{first:02}'"
+    return f"{column} between '{first:02}' and '{last:02}'"
+
+
+def _run_clause(run:Tuple) -> str:
+    if run[0] == 'years':
+        return f"({_eq_or_between('year', run[1], run[2])})"
+    if run[0] == 'months':
+        return f"(year = '{run[1]:02}' and {_eq_or_between('month', run[2], run[3])})"
+    return f"(year = '{run[1]:02}' and month = '{run[2]:02}' and {_eq_or_between('day', run[3], run[4])})"
+
+
+def _run_partition_specs(run:Tuple) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    if run[0] == 'years':
+        return [(f'{y:02}', None, None) for y in range(run[1], run[2] + 1)]
+    if run[0] == 'months':
+        return [(f'{run[1]:02}', f'{m:02}', None) for m in range(run[2], run[3] + 1)]
+    return [(f'{run[1]:02}', f'{run[2]:02}', f'{d:02}') for d in range(run[3], run[4] + 1)]
+
+
+def _join_clauses(clauses:List[str]) -> str:
+    or_str = '\n  or '
+    return f"({or_str.join(clauses)})"
+
+
+def _merged_ranges(start_dates, end_dates, caller:str) -> Tuple[Tuple[int, int], ...]:
+    # the merged ranges as a tuple of (start, end) day numbers, which is what the memos key on
+    import numpy as np
+    starts, ends = merge_date_ranges(start_dates, end_dates)
+    if starts.size == 0:
+        raise Exception(f"{caller}: no date ranges")
+    return tuple(zip(starts.astype(np.int64).tolist(), ends.astype(np.int64).tolist()))
+
+
+@lru_cache(maxsize=_hive_filter_cache_size)
+def _cached_partition_runs(ranges:Tuple[Tuple[int, int], ...]) -> Tuple[Tuple, ...]:
+    # merged ranges have at least a day between them, so their runs never join up
+    return tuple(run for start, end in ranges for run in _range_runs(start, end))
+
+
+@lru_cache(maxsize=_hive_filter_cache_size)
+def _cached_ranges_filter(ranges:Tuple[Tuple[int, int], ...], planner:bool) -> str:
+    import numpy as np
+    if planner:
+        return _join_clauses([_run_clause(run) for run in _cached_partition_runs(ranges)])
+    starts, ends = np.array(ranges, dtype=np.int64).T
+    return _join_clauses(_partition_clauses(starts, ends))
+
+
+def create_hive_multi_range_filter(start_dates, end_dates, planner:bool=False) -> str:
+    """
+    one hive filter selecting every day in any of the (start, end) ranges,
+    start_dates[i] to end_dates[i] inclusive
+
+      create_hive_multi_range_filter(['10/22/2019', '1/1/2020'], ['11/4/2019', '3/31/2020'])
+
+    overlapping and touching ranges are merged first so each partition is named once,
+    leap years are handled. dates can be strings, datetimes or datetime64
+
+    planner - emit the shortest predicate, runs of days, months and years become
+      between clauses, e.g. (year between '2018' and '2019'), instead of listing
+      every day and month. the length no longer grows with the length of the range
+    """
+    return _cached_ranges_filter(_merged_ranges(start_dates, end_dates, 'create_hive_multi_range_filter'), planner)
+
+
+def hive_partition_specs(start_dates, end_dates) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    """
+    the partitions covering the (start, end) ranges as (year, month, day) spec tuples,
+    for addressing partitions directly instead of filtering. each tuple is as
+    coarse as it can be, None means the whole level is covered
+
+      [('2017', '10', '31'), ('2017', '11', None), ('2017', '12', None), ('2018', None, None)]
+    """
+    runs = _cached_partition_runs(_merged_ranges(start_dates, end_dates, 'hive_partition_specs'))
+    return [spec for run in runs for spec in _run_partition_specs(run)]
+
+
+def create_hive_date_range_filters(start_dates, end_dates, planner:bool=False) -> List[str]:
+    """
+    a hive filter per (start, end) pair, e.g. one per patient window. same clause
+    forms as create_hive_multi_range_filter(), planner included, and pairs that
+    repeat are only worked out once
+    """
+    import numpy as np
+    starts = _as_days(start_dates).ravel()
+    ends = _as_days(end_dates).ravel()
+    if starts.shape != ends.shape:
+        raise Exception(f"create_hive_date_range_filters: {starts.size} start dates but {ends.size} end dates")
+    bad = ends < starts
+    if bad.any():
+        i = int(np.flatnonzero(bad)[0])
+        raise Exception(f"create_hive_date_range_filters: illegal date range {starts[i]}, {ends[i]}")
+    pairs = np.stack([starts.astype(np.int64), ends.astype(np.int64)], axis=1)
+    uniq, inverse = np.unique(pairs, axis=0, return_inverse=True)
+    filters = [_cached_ranges_filter(((int(start), int(end)),), planner) for start, end in uniq]
+    return [filters[i] for i in inverse.ravel()]
+
+
+def hive_filter_cache_info() -> Dict:
+    """ hits, misses, maxsize and currsize of the hive filter memos and the date string parser """
+    return {'date_range_filter': _cached_date_range_filter.cache_info(),
+            'ranges_filter': _cached_ranges_filter.cache_info(),
+            'partition_runs': _cached_partition_runs.cache_info(),
+            'parse_date': _parse_date_cached.cache_info()}
+
+
+def hive_filter_cache_clear() -> None:
+    _cached_date_range_filter.cache_clear()
+    _cached_ranges_filter.cache_clear()
+    _cached_partition_runs.cache_clear()
+    _parse_date_cached.cache_clear()
+
+
+def benchmark_hive_filters(years:List[int]=None, start_date:str='10/22/2010', repeats:int=20) -> List[Dict]:
+    """
+    predicate length and generation time, create_hive_date_range_filter() as it was
+    vs planner mode, for ranges of growing length in years. prints a table and
+    returns a row per range
+
+    the ms columns are cold, the memos are cleared before every call. warm_us is a
+    call answered from the memo, which is what repeated dashboard windows see
+    """
+    import time
+    from datetime import timedelta
+    rows = []
+    sd = parse_date(start_date)
+    # first call pays for importing numpy and building the calendar index, keep it out of the timings
+    create_hive_date_range_filter(start_date, start_date, planner=True)
+    for n_years in years or [1, 2, 5, 10, 20]:
+        end_date = (sd + timedelta(days=int(365.25 * n_years) - 17)).strftime('%m/%d/%Y')
+        row = {'years': n_years}
+        for label, planner in [('old', False), ('planner', True)]:
+            elapsed = 0.0
+            for _ in range(repeats):
+                hive_filter_cache_clear()
+                start = time.perf_counter()
+                predicate = create_hive_date_range_filter(start_date, end_date, planner=planner)
+                elapsed += time.perf_counter() - start
+            row[f'{label}_ms'] = elapsed * 1000 / repeats
+            row[f'{label}_chars'] = len(predicate)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            create_hive_date_range_filter(start_date, end_date, planner=True)
+        row['warm_us'] = (time.perf_counter() - start) * 1e6 / repeats
+        rows.append(row)
+        print("{years:>3} years: old {old_chars:>6,} chars {old_ms:7.2f} ms, "
+              "planner {planner_chars:>4,} chars {planner_ms:7.2f} ms, warm {warm_us:6.1f} us".format(**row))
+    return rows
+
+
 import unittest
+class TestCheckFilesWritable(unittest.TestCase):
+
+    def test_matches_check_file_writable(self):
+        import os
+        import tempfile
+        check_files_writable_cache_clear()
+        with tempfile.TemporaryDirectory() as tmp:
+            open(os.path.join(tmp, 'exists.csv'), 'w').close()
+            os.makedirs(os.path.join(tmp, 'a_dir'))
+            paths = [os.path.join(tmp, 'exists.csv'), os.path.join(tmp, 'new.csv'), os.path.join(tmp, 'a_dir'),
+                     os.path.join(tmp, 'missing', 'new.csv')]
+            paths += [os.path.join(tmp, f'patient_{i}.csv') for i in range(100)]
+            self.assertEqual(check_files_writable(paths), [check_file_writable(p) for p in paths])
+            self.assertEqual(check_files_writable(paths)[:4], [True, True, False, False])
+
+    def test_broken_symlink(self):
+        import os
+        import tempfile
+        check_files_writable_cache_clear()
+        with tempfile.TemporaryDirectory() as tmp:
+            link = os.path.join(tmp, 'link.csv')
+            os.symlink(os.path.join(tmp, 'nowhere', 'target.csv'), link)
+            self.assertEqual(check_files_writable([link]), [check_file_writable(link)])
+            # and through the directory listing
+            paths = [link] + [os.path.join(tmp, f'patient_{i}.csv') for i in range(_scandir_threshold + 1)]
+            self.assertEqual(check_files_writable(paths), [check_file_writable(p) for p in paths])
+
+    def test_cached_directory_deleted(self):
+        import os
+        import tempfile
+        check_files_writable_cache_clear()
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, 'out')
+            os.makedirs(out)
+            paths = [os.path.join(out, 'p1.csv')]
+            self.assertEqual(check_files_writable(paths), [True])
+            os.rmdir(out)
+            self.assertEqual(check_files_writable(paths), [check_file_writable(paths[0])])
+            self.assertEqual(check_files_writable(paths), [False])
+            self.assertEqual(check_files_writable(paths, create_dirs=True), [True])
+
+    def test_create_dirs(self):
+        import os
+        import tempfile
+        check_files_writable_cache_clear()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'out', 'patients', 'p1.csv')
+            self.assertEqual(check_files_writable([path], create_dirs=True), [True])
+            self.assertTrue(os.path.isdir(os.path.dirname(path)))
+
+
 class TestHiveDateRange(unittest.TestCase):
 
     def test_single_day(self):
@@ -231,8 +788,60 @@ class TestHiveDateRange(unittest.TestCase):
 
  
     def test_leap_year(self):
-        # ugh, not sure how to test this
-        # test for going to feb 19 - should only work in a leap year but...
-        self.assertEqual(create_hive_date_range_filter("2/10/2019", "2/28/2019"), "this test always fails for now ")
+        # feb 28th ends the month in 2019 but not in 2020
+        self.assertEqual(create_hive_date_range_filter("1/1/2019", "2/28/2019"),
+                        """((year = '2019' and month in ('01', '02'))""")
+        self.assertEqual(create_hive_date_range_filter("2/27/2020", "3/1/2020"),
+                        """((year = '2020' and month = '02' and day in ('27', '28', '29'))
+  or (year = '2020' and month = '03' and day in ('01')))""")
         with self.assertRaises(ValueError):
             create_hive_date_range_filter("2/10/2019", "2/29/2019")
+
+    def test_multi_range_merges_overlapping_and_touching(self):
+        self.assertEqual(create_hive_multi_range_filter(["10/22/2019", "10/25/2019", "11/1/2019", "12/1/2019"],
+                                                        ["10/30/2019", "10/31/2019", "11/30/2019", "12/2/2019"]),
+                        """((year = '2019' and month = '10' and day in ('22', '23', '24', '25', '26', '27', '28', '29', '30', '31'))
+  or (year = '2019' and month = '11')
+  or (year = '2019' and month = '12' and day in ('01', '02')))""")
+
+    def test_multi_range_whole_years_and_months(self):
+        self.assertEqual(create_hive_multi_range_filter(["1/1/2018", "2/1/2020"], ["12/31/2018", "3/31/2020"]),
+                        """((year = '2018')
+  or (year = '2020' and month in ('02', '03')))""")
+
+    def test_multi_range_leap_day(self):
+        self.assertEqual(create_hive_multi_range_filter(["2/1/2020"], ["2/28/2020"]),
+                        """((year = '2020' and month = '02' and day in ('01', '02', '03', '04', '05', '06', '07', '08', '09', '10', '11', '12', '13', '14', '15', '16', '17', '18', '19', '20', '21', '22', '23', '24', '25', '26', '27', '28')))""")
+        self.assertEqual(create_hive_multi_range_filter(["2/1/2020"], ["2/29/2020"]),
+                        """((year = '2020' and month = '02'))""")
+
+    def test_date_range_filters_per_pair(self):
+        filters = create_hive_date_range_filters(["10/1/2019", "1/1/2018", "10/1/2019"],
+                                                 ["10/1/2019", "12/31/2018", "10/1/2019"])
+        self.assertEqual(filters, ["""((year = '2019' and month = '10' and day in ('01')))""",
+                                   """((year = '2018'))""",
+                                   """((year = '2019' and month = '10' and day in ('01')))"""])
+
+    def test_planner_between_and_coalescing(self):
+        self.assertEqual(create_hive_date_range_filter("10/22/2017", "11/4/2020", planner=True),
+                        """((year = '2017' and month = '10' and day between '22' and '31')
+  or (year = '2017' and month between '11' and '12')
+  or (year between '2018' and '2019')
+  or (year = '2020' and month between '01' and '10')
+  or (year = '2020' and month = '11' and day between '01' and '04'))""")
+
+    def test_planner_single_day_and_month(self):
+        self.assertEqual(create_hive_date_range_filter("10/1/2019", "10/1/2019", planner=True),
+                        """((year = '2019' and month = '10' and day = '01'))""")
+        self.assertEqual(create_hive_multi_range_filter(["2/1/2020", "2/10/2020"], ["2/5/2020", "2/29/2020"], planner=True),
+                        """((year = '2020' and month = '02' and day between '01' and '05')
+  or (year = '2020' and month = '02' and day between '10' and '29'))""")
+
+    def test_partition_specs(self):
+        self.assertEqual(hive_partition_specs(["12/30/2017"], ["2/29/2020"]),
+                         [('2017', '12', '30'), ('2017', '12', '31'), ('2018', None, None), ('2019', None, None),
+                          ('2020', '01', None), ('2020', '02', None)])
+
+    def test_multi_range_illegal_range(self):
+        with self.assertRaises(Exception):
+            create_hive_multi_range_filter(["10/2/2019"], ["10/1/2019"])
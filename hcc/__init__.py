@@ -1,19 +1,47 @@
 # -*- coding: utf-8 -*-
 __version__ = "0.1.0"
 
-__all__ = ['icd_2_hcc', 'icd_2_hcc_mapping', 'hierarchy_filter', 'ClaimsDB']
+__all__ = ['icd_2_hcc', 'icd_2_hcc_many', 'icd_2_hcc_cache_info', 'icd_2_hcc_cache_clear',
+           'icd_2_hcc_mapping', 'hierarchy_filter', 'hierarchy_filter_many',
+           'build_hierarchy_index', 'save_hierarchy_index', 'load_hierarchy_index', 'load_mapping',
+           'ClaimsDB']
 
+import itertools
+import json
 import os
-from dateutil.parser import parse as date_parser
+import pickle
+import sqlite3
 from collections import defaultdict
-
-import apxapi
-from apxapi.hoisting import Code
-from apxapi.hoisting import ICD10
-from apxapi.hoisting import ICD9
+from collections.abc import Mapping
+from datetime import datetime
+from dateutil.parser import parse as date_parser
+from functools import lru_cache
+from joslib import _cache_dir
+from joslib.streamsupport import JsonStream, ResponseText, fetch_streaming
 
 _mapping_file = "./code_mappings.txt"
-_icd_10_date = date_parser("10/1/2015")
+_icd_10_date = datetime(2015, 10, 1)
+
+
+def _hoisting():
+    # apxapi is slow to import and most users of this module never need it,
+    # so it is imported the first time a Code is needed
+    from apxapi import hoisting
+    return hoisting
+
+
+def __getattr__(name):
+    # Code, ICD9 and ICD10 used to be imported here at module load, keep them reachable
+    if name in ('Code', 'ICD9', 'ICD10'):
+        return getattr(_hoisting(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _iter_claims(fp):
+    ''' (patient_uuid, history) pairs out of a claims archive, one patient in memory at a time '''
+    stream = JsonStream(fp)
+    for patient_uuid in stream.object_keys():
+        yield patient_uuid, stream.value()
 
 
 class ClaimsDB(object):
@@ -23,20 +51,139 @@ class ClaimsDB(object):
 
       for p in patient_list:
         print("{},{}\n".format(p, cdb.check_patient(p, clean=True))
+
+      or all at once
+      cdb.check_patients(patient_list, clean=True)
+
+    the first time we see a claims archive it is downloaded and converted into a
+    local SQLite file indexed by patient_uuid (in cache_dir, JOSLIB_CACHE_DIR or
+    ~/.cache/joslib by default). later sessions open that file directly and
+    check_patient only reads that one patient's claims. rebuild=True fetches
+    the archive again. the archive is streamed into SQLite a patient at a time,
+    it is never held in memory whole. a failed fetch raises
     '''
-    def __init__(self, claims_db_uuid, apx_session, claims_org=None):
-        r = apx_session.dataorchestrator.get_archive_document(claims_org, claims_db_uuid)
-        if r.status_code == 200:
-            self.claims_db = r.json()
-        else:
-            self.claims_db = None
-            
+    _batch_size = 10000
+
+    def __init__(self, claims_db_uuid, apx_session, claims_org=None, cache_dir=None, rebuild=False):
+        cache_dir = cache_dir or _cache_dir()
+        self.claims_db_file = os.path.join(cache_dir, f"claims-{claims_db_uuid}.sqlite")
+        self._conn = None
+        if rebuild or not os.path.exists(self.claims_db_file):
+            r = fetch_streaming(apx_session.dataorchestrator.get_archive_document, claims_org, claims_db_uuid)
+            try:
+                if r.status_code != 200:
+                    raise Exception("Fetch of claims archive {} failed, got {}".format(claims_db_uuid, r.status_code))
+                os.makedirs(cache_dir, exist_ok=True)
+                self._build(_iter_claims(ResponseText(r)), self.claims_db_file)
+            finally:
+                r.close()
+        self._conn = sqlite3.connect(self.claims_db_file, check_same_thread=False)
+
+    @classmethod
+    def _build(cls, claims, db_file):
+        # build into a temp file and move it into place so a failed build leaves nothing
+        # behind, the temp file is plain text claims so it is removed whatever goes wrong
+        tmp = f"{db_file}.{os.getpid()}"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        try:
+            conn = sqlite3.connect(tmp)
+            try:
+                conn.execute("CREATE TABLE claims (patient_uuid TEXT PRIMARY KEY, history TEXT NOT NULL)")
+                rows = ((patient_uuid, json.dumps(history)) for patient_uuid, history in claims)
+                while True:
+                    batch = list(itertools.islice(rows, cls._batch_size))
+                    if not batch:
+                        break
+                    conn.executemany("INSERT OR REPLACE INTO claims VALUES (?, ?)", batch)
+                conn.commit()
+            finally:
+                conn.close()
+            os.replace(tmp, db_file)
+        except BaseException:
+            for leftover in (tmp, tmp + '-journal'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+
+    def _db(self):
+        if self._conn is None:
+            raise Exception("ClaimsDB {} has been closed".format(self.claims_db_file))
+        return self._conn
+
+    @property
+    def claims_db(self):
+        ''' the SQLite connection, None once closed '''
+        return self._conn
+
+    @staticmethod
+    def _clean(stuff):
+        return [h[0]['c'] for h in stuff]
+
     def check_patient(self, patient_uuid, clean=False):
-        stuff = self.claims_db.get(patient_uuid, [])
+        row = self._db().execute("SELECT history FROM claims WHERE patient_uuid = ?",
+                                 (patient_uuid,)).fetchone()
+        stuff = json.loads(row[0]) if row else []
         if clean and stuff:
-            stuff = [h[0]['c'] for h in stuff]
+            stuff = self._clean(stuff)
         return stuff
 
+    def check_patients(self, patient_uuids, clean=False):
+        ''' check_patient() for a list of patients, returns a dict of patient_uuid -> claims '''
+        found = {}
+        patient_uuids = list(patient_uuids)
+        # stay under SQLite's limit on bound parameters
+        for i in range(0, len(patient_uuids), 500):
+            chunk = patient_uuids[i:i + 500]
+            query = "SELECT patient_uuid, history FROM claims WHERE patient_uuid IN ({})".format(
+                ','.join('?' * len(chunk)))
+            for patient_uuid, history in self._db().execute(query, chunk):
+                found[patient_uuid] = json.loads(history)
+
+        results = {}
+        for patient_uuid in patient_uuids:
+            stuff = found.get(patient_uuid, [])
+            results[patient_uuid] = self._clean(stuff) if clean and stuff else stuff
+        return results
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+
+_hcc_cache_size = 1 << 16
+
+@lru_cache(maxsize=_hcc_cache_size)
+def _cached_to_hcc(icd, mapping, label_or_payment_year):
+    # claims repeat the same (icd, mapping, payment year) over and over, so only
+    # build a Code once per distinct triple. tuple so callers can't mutate the cache
+    return tuple(_hoisting().Code(icd, mapping).toHcc(label_or_payment_year))
+
+
+def _hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def _to_hcc(icd, mapping, label_or_payment_year):
+    if all(map(_hashable, (icd, mapping, label_or_payment_year))):
+        return list(_cached_to_hcc(icd, mapping, label_or_payment_year))
+    # an unhashable mapping can't be a cache key, look it up the slow way
+    return list(_hoisting().Code(icd, mapping).toHcc(label_or_payment_year))
+
+
+def icd_2_hcc_cache_info():
+    ''' hits, misses, maxsize and currsize of the icd->hcc memo '''
+    return _cached_to_hcc.cache_info()
+
+
+def icd_2_hcc_cache_clear():
+    _cached_to_hcc.cache_clear()
 
 
 def icd_2_hcc(icd, dos=None, mapping=None, label_or_payment_year="2016-icd-hcc"):
@@ -45,8 +192,9 @@ def icd_2_hcc(icd, dos=None, mapping=None, label_or_payment_year="2016-icd-hcc")
             if not mapping:
                 # mostly worried taht the date might be bad
                 code_date = date_parser(dos)
-                mapping = ICD9 if code_date < _icd_10_date else ICD10
-            return Code(icd, mapping).toHcc(label_or_payment_year)
+                hoisting = _hoisting()
+                mapping = hoisting.ICD9 if code_date < _icd_10_date else hoisting.ICD10
+            return _to_hcc(icd, mapping, label_or_payment_year)
         except Exception as e:
             print("Exception {} occurred mapping icd->hcc: icd:{} dos:{} mapping:{}, label_or_payment:{}"
                   .format(e, icd, dos, mapping, label_or_payment_year))
@@ -55,25 +203,355 @@ def icd_2_hcc(icd, dos=None, mapping=None, label_or_payment_year="2016-icd-hcc")
         # make things go boom, dos or mapping required
         raise Exception("icd_2_hcc requires either DOS or a mapping")
 
-icd_2_hcc_mapping = defaultdict(str)
-def setup_mapping(mapping_file):
+
+def _icd9_mask(dos):
+    '''
+    True where the dos is before the ICD10 switch. each distinct dos string is
+    parsed once and the comparison is done on the whole array. unparseable dates
+    come back as None in the second array so the caller can report them
+    '''
+    import numpy as np
+    import pandas as pd
+
+    codes, uniques = pd.factorize(pd.Series(dos, dtype=object), use_na_sentinel=False)
+    parsed = []
+    for d in uniques:
+        try:
+            parsed.append(np.datetime64(date_parser(d), 'D'))
+        except Exception:
+            parsed.append(np.datetime64('NaT'))
+    parsed = np.array(parsed, dtype='datetime64[D]')
+    is_icd9 = (parsed < np.datetime64(_icd_10_date, 'D'))[codes]
+    bad = np.isnat(parsed)[codes]
+    return is_icd9, bad
+
+
+def icd_2_hcc_many(icds, dos=None, mapping=None, label_or_payment_year="2016-icd-hcc", as_frame=False):
+    '''
+    icd_2_hcc() for many codes at once
+
+    icds     - list/array/Series of ICD codes
+    dos      - dates of service lined up with icds, used to pick ICD9 vs ICD10
+    mapping  - one mapping for every code, instead of dos
+    as_frame - return an exploded DataFrame (icd, dos, hcc), one row per hcc,
+      rather than a list of hcc lists
+
+    lookups go through the same bounded memo as icd_2_hcc(), see icd_2_hcc_cache_info()
+    '''
+    icds = list(icds)
+    if mapping:
+        mappings = [mapping] * len(icds)
+        bad = [False] * len(icds)
+    elif dos is not None:
+        dos = list(dos)
+        if len(dos) != len(icds):
+            raise ValueError("icd_2_hcc_many: icds and dos must be the same length")
+        is_icd9, bad = _icd9_mask(dos)
+        hoisting = _hoisting()
+        mappings = [hoisting.ICD9 if i9 else hoisting.ICD10 for i9 in is_icd9]
+    else:
+        # make things go boom, dos or mapping required
+        raise Exception("icd_2_hcc_many requires either DOS or a mapping")
+
+    hccs = []
+    for i, (icd, m) in enumerate(zip(icds, mappings)):
+        if bad[i]:
+            print("Exception bad dos mapping icd->hcc: icd:{} dos:{}".format(icd, dos[i]))
+            hccs.append([])
+            continue
+        try:
+            hccs.append(_to_hcc(icd, m, label_or_payment_year))
+        except Exception as e:
+            print("Exception {} occurred mapping icd->hcc: icd:{} mapping:{}, label_or_payment:{}"
+                  .format(e, icd, m, label_or_payment_year))
+            hccs.append([])
+
+    if not as_frame:
+        return hccs
+    import pandas as pd
+    return pd.DataFrame({'icd': icds, 'dos': dos if dos is not None else None, 'hcc': hccs}).explode('hcc')
+
+def _read_mapping(mapping_file):
     # todo, convert this file to csv, but it works now...
+    table = {}
     with open(mapping_file) as mf:
         for line in mf:
             (s, c, apxs, apxc) = line.strip().split("\t")
-            icd_2_hcc_mapping[(s, c)] = apxc
+            table[(s, c)] = apxc
             assert apxs == "APXCAT"
+    return table
+
+
+def _load_mapping(mapping_file, cache_dir=None):
+    '''
+    the mapping table from its compiled pickle when there is one for this exact
+    version of the text file (name, mtime and size are in the pickle's name),
+    otherwise parse the text and leave a pickle behind for the next process
+    '''
+    cache_dir = cache_dir or _cache_dir()
+    st = os.stat(mapping_file)
+    base = os.path.splitext(os.path.basename(mapping_file))[0]
+    compiled = os.path.join(cache_dir, f"{base}-{st.st_mtime_ns}-{st.st_size}.pickle")
+    try:
+        with open(compiled, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        pass
+
+    table = _read_mapping(mapping_file)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f"{compiled}.{os.getpid()}"
+        with open(tmp, 'wb') as f:
+            pickle.dump(table, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, compiled)
+    except OSError as e:
+        print(f"unable to cache the code mapping table in {cache_dir}: {e}")
+    return table
 
 
-def hierarchy_filter(hcc_list):
-    children_codes = []
+class _LazyCodeMapping(Mapping):
+    '''
+    (code system, code) -> APXCAT category, loaded the first time it is used
+    missing codes give '' like the defaultdict(str) this used to be
+
+    call load() before forking worker processes and they all share the one
+    read only copy instead of each loading their own
+    '''
+    def __init__(self, mapping_files):
+        self._mapping_files = list(mapping_files)
+        self._table = None
+
+    def load(self):
+        if self._table is None:
+            table = {}
+            for mapping_file in self._mapping_files:
+                table.update(_load_mapping(mapping_file))
+            self._table = table
+        return self._table
+
+    def add_mapping_file(self, mapping_file):
+        self._mapping_files.append(mapping_file)
+        if self._table is not None:
+            self._table.update(_load_mapping(mapping_file))
+
+    def __getitem__(self, key):
+        return self.load().get(key, '')
+
+    def get(self, key, default=None):
+        return self.load().get(key, default)
+
+    def __contains__(self, key):
+        return key in self.load()
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+
+icd_2_hcc_mapping = _LazyCodeMapping([os.path.join(os.path.dirname(__file__), _mapping_file)])
+
+def setup_mapping(mapping_file):
+    ''' add another mapping file to icd_2_hcc_mapping '''
+    icd_2_hcc_mapping.add_mapping_file(mapping_file)
+
+
+def load_mapping():
+    ''' load icd_2_hcc_mapping now rather than on first use, eg. before forking workers '''
+    return len(icd_2_hcc_mapping.load())
+
+
+## parent -> children index for the HCC hierarchies, version -> {hcc: frozenset(child codes)}
+## filled in on demand, by build_hierarchy_index() or from a file with load_hierarchy_index()
+_hierarchy_index = defaultdict(dict)
+
+def _hcc_children(hcc, version='HCCV22'):
+    index = _hierarchy_index[version]
+    children = index.get(hcc)
+    if children is None:
+        children = index[hcc] = frozenset(c.code for c in _hoisting().Code(hcc, version).children())
+    return children
+
+
+def build_hierarchy_index(hccs=None, version='HCCV22'):
+    '''
+    work out the children of every hcc in hccs up front, so hierarchy filtering
+    never has to ask apxapi again. with no hccs we use every V22 category in the
+    code mapping table (the part after 'V22_')
+    '''
+    if hccs is None:
+        hccs = sorted({c[len('V22_'):] for c in icd_2_hcc_mapping.values() if c.startswith('V22_')})
+    for hcc in hccs:
+        _hcc_children(hcc, version)
+    return len(_hierarchy_index[version])
+
+
+def save_hierarchy_index(file_name):
+    with open(file_name, 'w') as f:
+        json.dump({version: {hcc: sorted(children) for hcc, children in index.items()}
+                   for version, index in _hierarchy_index.items()}, f)
+
+
+def load_hierarchy_index(file_name):
+    with open(file_name) as f:
+        for version, index in json.load(f).items():
+            _hierarchy_index[version].update({hcc: frozenset(children) for hcc, children in index.items()})
+
+
+def hierarchy_filter(hcc_list, version='HCCV22'):
+    children_codes = set()
     for hcc in hcc_list:
-        children_codes += Code(hcc, 'HCCV22').children()
-    
-    children_codes = [c.code for c in children_codes]
-    return set(hcc_list) - set(children_codes)
+        children_codes.update(_hcc_children(hcc, version))
+    return set(hcc_list) - children_codes
+
+
+def hierarchy_filter_many(patients, version='HCCV22'):
+    '''
+    hierarchy_filter() for a whole population in one go
+
+    patients - a dict of patient -> hcc list, a list of hcc lists, or a boolean
+      patient x hcc DataFrame
+
+    we build the patient x hcc boolean matrix M and the parent x child matrix C
+    over the hccs that show up, M @ C marks every hcc that has a parent present,
+    and those are dropped. returns the same shape that came in, with sets for
+    the dict and list forms
+    '''
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(patients, pd.DataFrame):
+        hccs = list(patients.columns)
+        present = patients.to_numpy(dtype=bool)
+    else:
+        keys = list(patients) if isinstance(patients, dict) else None
+        hcc_lists = [patients[k] for k in keys] if keys is not None else list(patients)
+        hccs = sorted({h for hl in hcc_lists for h in hl})
+        column = {h: i for i, h in enumerate(hccs)}
+        present = np.zeros((len(hcc_lists), len(hccs)), dtype=bool)
+        for row, hl in enumerate(hcc_lists):
+            present[row, [column[h] for h in hl]] = True
+
+    column = {h: i for i, h in enumerate(hccs)}
+    parent_of = np.zeros((len(hccs), len(hccs)), dtype=bool)
+    for i, hcc in enumerate(hccs):
+        for child in _hcc_children(hcc, version):
+            if child in column:
+                parent_of[i, column[child]] = True
+
+    keep = present & ~(present @ parent_of)
+
+    if isinstance(patients, pd.DataFrame):
+        return pd.DataFrame(keep, index=patients.index, columns=patients.columns)
+    hcc_array = np.array(hccs, dtype=object)
+    filtered = [set(hcc_array[row]) for row in keep]
+    return dict(zip(keys, filtered)) if keys is not None else filtered
+
+
+import unittest
+class TestIcd2Hcc(unittest.TestCase):
+    """ the icd->hcc memo with a fake hoisting module """
+
+    def _hoisting(self):
+        class Code(object):
+            made = 0
+
+            def __init__(self, icd, mapping):
+                Code.made += 1
+                self.icd = icd
+                self.mapping = mapping
+
+            def toHcc(self, label_or_payment_year):
+                if self.icd == 'broken':
+                    raise TypeError('toHcc blew up')
+                return [f'HCC-{self.icd}']
+
+        class Hoisting(object):
+            ICD9 = 'icd9'
+            ICD10 = 'icd10'
+        Hoisting.Code = Code
+        return Hoisting
+
+    def test_unhashable_mapping(self):
+        import contextlib
+        import io
+        from unittest import mock
+        hoisting = self._hoisting()
+        icd_2_hcc_cache_clear()
+        with mock.patch(f'{__name__}._hoisting', return_value=hoisting), contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(icd_2_hcc('E11', mapping={'E11': 'HCC19'}), ['HCC-E11'])
+            self.assertEqual(icd_2_hcc_many(['E11', 'I10'], mapping=['custom']), [['HCC-E11'], ['HCC-I10']])
+            self.assertEqual(icd_2_hcc('E11', mapping='icd10'), ['HCC-E11'])
+        self.assertEqual(icd_2_hcc_cache_info().currsize, 1)
+
+    def test_error_inside_lookup_runs_once(self):
+        import contextlib
+        import io
+        from unittest import mock
+        hoisting = self._hoisting()
+        icd_2_hcc_cache_clear()
+        with mock.patch(f'{__name__}._hoisting', return_value=hoisting), contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(icd_2_hcc('broken', mapping='icd10'), [])
+        self.assertEqual(hoisting.Code.made, 1)
+
+
+class TestClaimsDB(unittest.TestCase):
+    """ ClaimsDB against a fake dataorchestrator, no network """
+
+    class _Response(object):
+        encoding = None
+
+        def __init__(self, status_code, body=b''):
+            self.status_code = status_code
+            self.body = body
+            self.closed = False
+
+        def iter_content(self, chunk_size):
+            for i in range(0, len(self.body), 7):
+                yield self.body[i:i + 7]
+
+        def close(self):
+            self.closed = True
+
+    def _session(self, response):
+        class DataOrchestrator(object):
+            def get_archive_document(self, org, uuid, stream=False):
+                return response
 
+        class Session(object):
+            dataorchestrator = DataOrchestrator()
+        return Session()
 
+    def test_build_and_lookup(self):
+        import tempfile
+        claims = {'p1': [[{'c': 'E11'}]], 'p2': [[{'c': 'I10'}], [{'c': 'N18'}]]}
+        response = self._Response(200, json.dumps(claims).encode())
+        with tempfile.TemporaryDirectory() as tmp:
+            cdb = ClaimsDB('arch', self._session(response), cache_dir=tmp)
+            self.assertEqual(cdb.check_patient('p2', clean=True), ['I10', 'N18'])
+            self.assertEqual(cdb.check_patients(['p1', 'p3'], clean=True), {'p1': ['E11'], 'p3': []})
+            cdb.close()
+            with self.assertRaises(Exception):
+                cdb.check_patient('p1')
+        self.assertTrue(response.closed)
 
-setup_mapping(os.path.join(os.path.dirname(__file__), _mapping_file))
+    def test_truncated_archive_leaves_nothing(self):
+        import tempfile
+        body = json.dumps({f'p{i}': [[{'c': 'E11'}]] for i in range(100)}).encode()
+        response = self._Response(200, body[:len(body) // 2])
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaises(ValueError):
+                ClaimsDB('arch', self._session(response), cache_dir=tmp)
+            self.assertEqual(os.listdir(tmp), [])
+        self.assertTrue(response.closed)
 
+    def test_failed_fetch_raises_and_closes(self):
+        import tempfile
+        response = self._Response(500, b'<html>oops</html>')
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaises(Exception):
+                ClaimsDB('arch', self._session(response), cache_dir=tmp)
+            self.assertEqual(os.listdir(tmp), [])
+        self.assertTrue(response.closed)
@@ -8,9 +8,112 @@ and random forests.
 
 This class is available for both testing and development purposes
 the companion subpackage "utils" contains a number of convenience functions
+and "batch" has SignalBatch, a columnar container for bulk signal tables
+
+Signals are slotted and their repeated strings interned, we hold millions of
+them for patient level work. hand a Signal a RawSignalRef (utils.iter_signals
+does this when debug=True) and it keeps only the file offset of its raw record,
+not the record itself, the raw json is read back from the dump on demand
 '''
 __version__ = "0.1.0"
-__all__ = ['Signal']
+__all__ = ['Signal', 'RawSignalRef', 'SOURCE_TYPES']
+
+
+import codecs
+import json
+import sys
+import traceback
+
+# source types in the order of their small int kind, the key we read the source
+# value from is in the same position of _source_keys
+SOURCE_TYPES = ('PageWindowSource', 'DocumentSource', 'PageSource', 'PatientSource')
+_source_keys = ('centroid', 'pages', 'page', 'patient')
+_source_kinds = {t: i for i, t in enumerate(SOURCE_TYPES)}
+
+
+class RawSignalRef(object):
+    '''
+    where a raw signal lives in its dump, file name and byte offset of the record
+    load() reads just that one record back
+    '''
+    __slots__ = ('file_name', 'offset')
+
+    def __init__(self, file_name, offset):
+        self.file_name = file_name
+        self.offset = offset
+
+    def __repr__(self):
+        return "RawSignalRef({!r}, {})".format(self.file_name, self.offset)
+
+    def load(self, chunk_size=1 << 16):
+        decoder = json.JSONDecoder()
+        text_decoder = codecs.getincrementaldecoder('utf-8')()
+        text = ''
+        with open(self.file_name, 'rb') as dump:
+            dump.seek(self.offset)
+            while True:
+                chunk = dump.read(chunk_size)
+                text += text_decoder.decode(chunk, final=not chunk)
+                # the offset may sit on whitespace before the record, raw_decode won't skip it
+                start = len(text) - len(text.lstrip())
+                if start == len(text) and chunk:
+                    continue
+                try:
+                    return decoder.raw_decode(text, start)[0]
+                except json.JSONDecodeError:
+                    if not chunk:
+                        raise
+
+
+def _unpack(signal):
+    '''
+    split a raw signal into signal_source, source_name, source, generator_name, generator
+    Ref wraps source and generator in a [type_name, object] list, SMAS does not
+    '''
+    if type(signal['source']) == list:
+        return 'ref', signal['source'][0], signal['source'][1], signal['generator'][0], signal['generator'][1]
+    return 'smas', None, signal['source'], None, signal['generator']
+
+
+def _source_fields(source):
+    '''
+    work out source_type, source_key, doc_uuid and pat_uuid for a source object
+    '''
+    # figure out all the source stuff
+    if 'centroid' in source:
+        source_type, source_key = 'PageWindowSource', 'centroid'
+    elif 'pages' in source:
+        source_type, source_key = 'DocumentSource', 'pages'
+    elif 'page' in source:
+        source_type, source_key = 'PageSource', 'page'
+    elif 'patientId' in source or 'id' in source:
+        source_type, source_key = 'PatientSource', 'patient'
+    else:
+        raise ValueError("bad source: {}".format(source))
+
+    # document_uuid is messy
+    if 'doc' in source:
+        _doc = source['doc']
+        doc_uuid = _doc['uuid'] if 'uuid' in _doc else _doc['uuidString']
+    elif 'documentId' in source:
+        doc_uuid = source['documentId']['uuid']
+    else:
+        doc_uuid = 'NA'
+
+    # patient_uuid is even messier
+    # 'pat' and 'patientId' found in Ref and SMAS
+    # 'id' found only in SMAS
+    if 'pat' in source:
+        _pat = source['pat']
+        pat_uuid = _pat['uuid'] if 'uuid' in _pat else _pat['uuidString']
+    elif 'id' in source:
+        pat_uuid = source['id']['uuidString']
+    elif 'patientId' in source:
+        pat_uuid = source['patientId']['uuid']
+    else:
+        raise ValueError("have a patID we dont know about: {}".format(source))
+
+    return source_type, source_key, doc_uuid, pat_uuid
 
 
 class Signal(object):
@@ -20,95 +123,74 @@ class Signal(object):
     and even within the *same* source the serialization is not consistent 
     for example the SMAS files will use both doc and documentId keys to access 
     information about the document :( 
+
+    signal  - raw json signal, ref or smas flavored
+    debug   - keep the raw signal around for signal_object
+    raw_ref - RawSignalRef for the raw signal. when given we keep it instead of
+      the raw signal, and the source and generator objects are also read back
+      through it rather than held, which is most of a Signal's memory
     '''
-    def __init__(self, signal, debug=False):
+    __slots__ = ('_from_ref', '_kind', '_source_name', '_source', '_generator_name',
+                 '_generator', '_doc_uuid', '_pat_uuid', '_source_val', '_start_page',
+                 '_end_page', '_name', '_sig_type', '_value', '_weight', '_signal', '_raw_ref')
+
+    def __init__(self, signal, debug=False, raw_ref=None):
+        self._signal = None
+        self._raw_ref = raw_ref
         try:
-            # Ref provides a list for source
-            if type(signal['source']) == list:
-                self._source_name = signal['source'][0]
-                self._source = signal['source'][1] 
-                self._generator_name = signal['generator'][0]
-                self._generator = signal['generator'][1]
-                self._signal_source = 'ref'
-            else:
-                self._source = signal['source']
-                self._generator = signal['generator']
-                self._signal_source = 'smas'
-                self._source_name = None
-                self._generator_name = None
-
-            # figure out all the source stuff
-            if 'centroid' in self._source:
-                self._source_type = 'PageWindowSource'
-                self._source_key = 'centroid'
-            elif 'pages' in self._source:
-                self._source_type = 'DocumentSource'
-                self._source_key = 'pages'            
-            elif 'page' in self._source:
-                self._source_type = 'PageSource'
-                self._source_key = 'page' 
-            elif 'patientId' in self._source or 'id' in self._source:
-                self._source_type = 'PatientSource'
-                self._source_key = 'patient' 
-            else:
-                print("bad source: {}".format(source))
-                return 'UnkSource', 'UnkSourceType'
-            
-            # document_uuid is messy
-            if 'doc' in self._source:
-                _doc = self._source['doc']
-                if 'uuid' in _doc:
-                    self._doc_uuid = _doc['uuid'] 
-                else:
-                    self._doc_uuid = _doc['uuidString'] 
-            elif 'documentId' in self._source:
-                self._doc_uuid = self._source['documentId']['uuid']
-            else:
-                self._doc_uuid = 'NA'
-                
-            # patient_uuid is even messier
-            # 'pat' and 'patientId' found in Ref and SMAS
-            # 'id' found only in SMAS
-            if 'pat' in self._source:
-                _pat = self._source['pat']
-                if 'uuid' in _pat:
-                    self._pat_uuid = _pat['uuid']
-                else:
-                    self._pat_uuid = _pat['uuidString']
-            elif 'id' in self._source:
-                self._pat_uuid = self._source['id']['uuidString']
-            elif 'patientId' in self._source:
-                self._pat_uuid = self._source['patientId']['uuid']
-            else:
-                print(self._source)
-                raise("have a patID we dont know about")
-                
-            self._source_val = self._source[self._source_key] if self._source_key in self._source else -1
-            self._end_page = self._source['endPage'] if self._source_type == 'PageWindowSource' else -1
-            self._start_page = self._source['startPage'] if self._source_type == 'PageWindowSource' else -1        
-            self._name = signal['name']
-            self._sig_type = signal['sigType']
+            signal_source, source_name, source, generator_name, generator = _unpack(signal)
+            source_type, source_key, doc_uuid, pat_uuid = _source_fields(source)
+            self._from_ref = signal_source == 'ref'
+            self._kind = _source_kinds[source_type]
+            self._source_name = _intern(source_name)
+            self._generator_name = _intern(generator_name)
+            self._doc_uuid = _intern(doc_uuid)
+            self._pat_uuid = _intern(pat_uuid)
+
+            self._source_val = source[source_key] if source_key in source else -1
+            self._end_page = source['endPage'] if source_type == 'PageWindowSource' else -1
+            self._start_page = source['startPage'] if source_type == 'PageWindowSource' else -1        
+            self._name = _intern(signal['name'])
+            self._sig_type = _intern(signal['sigType'])
             #self._value = signal['value'][1] if type(signal['value']) == list else signal['value']
             self._value = signal['value']
             self._weight = signal['wt']
 
-            if debug:
-                self._signal = signal
+            if raw_ref is None:
+                self._source = source
+                self._generator = generator
+                if debug:
+                    self._signal = signal
+            else:
+                self._source = None
+                self._generator = None
         except Exception as e:
             print("Exception initializing Signal: type={}, args={}".format(type(e), e.args))
             print("signal: {}".format(signal))
             traceback.print_exc()
 
     def to_smas_json(self):
+        if self._source is None and self._raw_ref is not None:
+            # one seek and parse of the dump record for both objects
+            _, _, source, _, generator = self._load_raw()
+        else:
+            source, generator = self._source, self._generator
         return {
             'name': self._name,
             'sigType': self._sig_type,
             'value': self._value,
-            'source': [self._source_name, self._source],
-            'generator': [self._generator_name, self._generator],
+            'source': [self._source_name, source],
+            'generator': [self._generator_name, generator],
             'wt': self._weight
         }
 
+    def _load_raw(self):
+        return _unpack(self._raw_ref.load())
+
+    @property
+    def signal_source(self):
+        return 'ref' if self._from_ref else 'smas'
+
     @property
     def pat_uuid(self):
         return self._pat_uuid
@@ -119,7 +201,12 @@ class Signal(object):
         
     @property
     def source_type(self):
-        return self._source_type
+        return SOURCE_TYPES[self._kind]
+
+    @property
+    def source_kind(self):
+        ''' small int index of source_type in SOURCE_TYPES '''
+        return self._kind
         
     @property
     def source_value(self):
@@ -140,6 +227,7 @@ class Signal(object):
     @property
     def generator_name(self):
         return self._generator_name
+
     @property
     def name(self):
         return self._name
@@ -154,8 +242,26 @@ class Signal(object):
 
     @property
     def source_object(self):
+        if self._source is None and self._raw_ref is not None:
+            return self._load_raw()[2]
         return self._source
 
+    @property
+    def generator_object(self):
+        if self._generator is None and self._raw_ref is not None:
+            return self._load_raw()[4]
+        return self._generator
+
+    @property
+    def raw_ref(self):
+        return self._raw_ref
+
     @property
     def signal_object(self):
+        if self._signal is None and self._raw_ref is not None:
+            return self._raw_ref.load()
         return self._signal
+
+
+def _intern(s):
+    return sys.intern(s) if type(s) == str else s
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+'''
+SignalBatch - columnar container for large signal tables
+
+building a Signal per row just to read nine fields back out is where the time
+goes when we write tens of millions of signals. a SignalBatch decodes a chunk
+of raw json signals straight into column arrays, strings that repeat a lot
+(pat_uuid, doc_uuid, name, source_type) are dictionary encoded into small int
+codes, and the whole thing goes to a DataFrame or csv without ever making a
+Python object per signal
+
+  for batch in iter_signal_batches(iter_raw_signals(dump_file)):
+      batch.to_csv(out, header=first)
+'''
+from typing import List, Dict, Iterable, Iterator, Optional
+import csv
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from joslib.signal import _unpack, _source_fields
+
+__version__ = "0.1.0"
+__all__ = ['SignalBatch', 'iter_signal_batches']
+
+
+class _Dictionary(object):
+    '''
+    string -> code table, codes are handed out in order of first appearance
+    so a dictionary shared between batches keeps their codes compatible
+    '''
+    def __init__(self):
+        self.codes:Dict[str, int] = {}
+        self.values:List[str] = []
+
+    def encode(self, value:str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class SignalBatch(object):
+    '''
+    a chunk of signals held as columns
+
+    pat_uuid, doc_uuid, name, source_type - int32 codes into the matching dictionary
+    source_value, value, wt               - object arrays, these are whatever json gave us
+                                            so they print exactly as the row writer does
+    start_page, end_page                  - int64, -1 when not a PageWindowSource
+    '''
+    # same columns and order as the csv tables in signal.utils
+    header = ["pat_uuid", "doc_uuid", "sig_type", "source_val_type",
+              "source_location", "start_page", "end_page", "value", "wt"]
+    _encoded = ['pat_uuid', 'doc_uuid', 'name', 'source_type']
+    # column for each header entry
+    _columns = ['pat_uuid', 'doc_uuid', 'name', 'source_type', 'source_value',
+                'start_page', 'end_page', 'value', 'wt']
+
+    def __init__(self, columns:Dict[str, np.ndarray], dictionaries:Dict[str, _Dictionary]):
+        self.columns = columns
+        self.dictionaries = dictionaries
+
+    def __len__(self):
+        return len(self.columns['wt'])
+
+    @staticmethod
+    def new_dictionaries() -> Dict[str, _Dictionary]:
+        return {c: _Dictionary() for c in SignalBatch._encoded}
+
+    @classmethod
+    def from_raw(cls, raw_signals:Iterable[Dict], dictionaries:Optional[Dict[str, _Dictionary]]=None) -> 'SignalBatch':
+        '''
+        decode raw json signals (ref or smas) into a batch
+
+        dictionaries - pass the same dictionaries to every batch of a run and their
+          codes line up, which is what concat() needs
+        '''
+        if dictionaries is None:
+            dictionaries = cls.new_dictionaries()
+        pat, doc, name, stype = [], [], [], []
+        source_value, start_page, end_page, value, wt = [], [], [], [], []
+        encode_pat = dictionaries['pat_uuid'].encode
+        encode_doc = dictionaries['doc_uuid'].encode
+        encode_name = dictionaries['name'].encode
+        encode_stype = dictionaries['source_type'].encode
+
+        for sig in raw_signals:
+            # everything that can go wrong with one signal happens in here, so a bad
+            # signal is skipped on its own instead of failing the column build
+            try:
+                source = _unpack(sig)[2]
+                source_type, source_key, doc_uuid, pat_uuid = _source_fields(source)
+                is_window = source_type == 'PageWindowSource'
+                row = (source.get(source_key, -1),
+                       _page(source['startPage']) if is_window else -1,
+                       _page(source['endPage']) if is_window else -1,
+                       sig['value'], _weight(sig['wt']), sig['name'])
+            except Exception as e:
+                print("Exception decoding signal: type={}, args={}".format(type(e), e.args))
+                print("signal: {}".format(sig))
+                continue
+            pat.append(encode_pat(pat_uuid))
+            doc.append(encode_doc(doc_uuid))
+            stype.append(encode_stype(source_type))
+            name.append(encode_name(row[5]))
+            source_value.append(row[0])
+            start_page.append(row[1])
+            end_page.append(row[2])
+            value.append(row[3])
+            wt.append(row[4])
+
+        columns = {
+            'pat_uuid': np.array(pat, dtype=np.int32),
+            'doc_uuid': np.array(doc, dtype=np.int32),
+            'name': np.array(name, dtype=np.int32),
+            'source_type': np.array(stype, dtype=np.int32),
+            'source_value': _object_array(source_value),
+            'start_page': np.array(start_page, dtype=np.int64),
+            'end_page': np.array(end_page, dtype=np.int64),
+            'value': _object_array(value),
+            'wt': _object_array(wt),
+        }
+        return cls(columns, dictionaries)
+
+    @classmethod
+    def concat(cls, batches:List['SignalBatch']) -> 'SignalBatch':
+        ''' glue batches together, they must share their dictionaries '''
+        if not batches:
+            return cls.from_raw([])
+        dictionaries = batches[0].dictionaries
+        if any(b.dictionaries is not dictionaries for b in batches):
+            raise ValueError("SignalBatch.concat: batches must share dictionaries")
+        columns = {c: np.concatenate([b.columns[c] for b in batches]) for c in batches[0].columns}
+        return cls(columns, dictionaries)
+
+    def decoded(self, column:str) -> np.ndarray:
+        ''' the string values of a dictionary encoded column '''
+        values = np.array(self.dictionaries[column].values, dtype=object)
+        return values[self.columns[column]]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        '''
+        DataFrame with the csv table columns, the encoded columns come out as
+        categoricals so nothing is expanded back into per row strings
+        '''
+        data = {}
+        for column, out_name in zip(self._columns, self.header):
+            if column in self.dictionaries:
+                data[out_name] = pd.Categorical.from_codes(
+                    self.columns[column], categories=list(self.dictionaries[column].values))
+            else:
+                data[out_name] = self.columns[column]
+        return pd.DataFrame(data, columns=self.header)
+
+    def rows(self) -> Iterator[tuple]:
+        ''' the batch as rows of the csv signal table '''
+        columns = [self.decoded(c) if c in self.dictionaries else self.columns[c] for c in self._columns]
+        return zip(*[c.tolist() for c in columns])
+
+    def to_csv(self, path_or_buf, header:bool=True) -> None:
+        '''
+        write the batch as rows of the csv signal table, with the csv module so the
+        bytes are the same as write_signal_table() writes for the same signals
+        '''
+        if isinstance(path_or_buf, str):
+            with open(path_or_buf, 'w') as out:
+                return self.to_csv(out, header)
+        writer = csv.writer(path_or_buf)
+        if header:
+            writer.writerow(self.header)
+        writer.writerows(self.rows())
+
+
+def _page(page) -> int:
+    # int() would quietly truncate 2.5 or take '7', neither is a page number
+    if isinstance(page, bool) or int(page) != page:
+        raise ValueError(f"bad page number {page!r}")
+    return int(page)
+
+
+def _weight(wt):
+    # checked but kept as given so it prints the way the row writer prints it
+    if wt is not None:
+        float(wt)
+    return wt
+
+
+def _object_array(values:List) -> np.ndarray:
+    # np.array would turn lists of lists into a 2d array, so fill an empty object array
+    arr = np.empty(len(values), dtype=object)
+    for i, v in enumerate(values):
+        arr[i] = v
+    return arr
+
+
+def iter_signal_batches(raw_signals:Iterable[Dict], batch_size:int=100000,
+                        dictionaries:Optional[Dict[str, _Dictionary]]=None) -> Iterator[SignalBatch]:
+    '''
+    chunk a stream of raw signals into SignalBatches of up to batch_size signals,
+    all batches from one call share their dictionaries
+    '''
+    if dictionaries is None:
+        dictionaries = SignalBatch.new_dictionaries()
+    raw_signals = iter(raw_signals)
+    while True:
+        chunk = list(itertools.islice(raw_signals, batch_size))
+        if not chunk:
+            return
+        yield SignalBatch.from_raw(chunk, dictionaries)
@@ -14,10 +14,26 @@ To read in one of these files use read_signal_file()
 
 '''
 from collections import namedtuple
+import collections
 import csv
+import itertools
+import json
+import os
+import re
+import zlib
+
+import pandas as pd
+
+from joslib.signal import Signal, RawSignalRef, _unpack, _source_fields
+from joslib.signal.batch import SignalBatch, iter_signal_batches
+from joslib.streamsupport import JsonStream
 
 __version__ = "0.1.0"
-__all__=['read_signal_file']
+__all__=['read_signal_file', 'read_signal_files', 'DocSignals', 'DocF2FCounts',
+         'f2f_fraction_policy', 'f2f_probability_policy', 'f2f_roc', 'iter_raw_signals', 'iter_signals', 'write_signal_table',
+         'write_signal_batches', 'write_smas_json', 'set_json_backend', 'get_json_backend',
+         'available_json_backends', 'benchmark_json_backends', 'measure_signal_memory', 'diff_csv_files_sharded',
+         'read_signal_frame', 'diff_signal_frames']
 
 # coming soon.... __all__ = [a lot more stuff ]
 
@@ -41,7 +57,118 @@ def _parse_record(r, doc_signals):
        
 
 
+def _f2f_page_value(improved_f2f, improved_f2f_value):
+    # the probability behind the f2f call, if it is missing we fall back to the call itself
+    try:
+        return float(improved_f2f_value)
+    except (TypeError, ValueError):
+        # '' or not a number, or None when the csv row is short
+        return 1.0 if improved_f2f == 'true' else 0.0
+
+
+def _parse_record_counts(r, doc_counts):
+    ''' _parse_record() for DocF2FCounts, keeps running totals instead of a list '''
+    if r['improved_f2f'] != '':
+        doc_counts.add_page(r['improved_f2f'] == 'true',
+                            _f2f_page_value(r['improved_f2f'], r['improved_f2f_value']))
+    elif r['hcc_dict'] != '':
+        if r['hcc_dict'].startswith('V22'):
+            doc_counts.dicthits.add(r['hcc_dict'])
+
+
+class DocF2FCounts(object):
+    '''
+    per document totals standing in for the DocSignals.f2f list, so deciding f2f
+    is O(1) and a chart with hundreds of pages costs three numbers
+
+    pages         - pages with an improved_f2f call
+    f2f_pages     - of those, pages called f2f
+    f2f_value_sum - sum of the improved_f2f_value probabilities of those pages
+    dicthits      - V22 dictionary hits, same as DocSignals
+    '''
+    __slots__ = ('pages', 'f2f_pages', 'f2f_value_sum', 'dicthits')
+
+    def __init__(self, pages=0, f2f_pages=0, f2f_value_sum=0.0, dicthits=None):
+        self.pages = pages
+        self.f2f_pages = f2f_pages
+        self.f2f_value_sum = f2f_value_sum
+        self.dicthits = set() if dicthits is None else dicthits
+
+    def __repr__(self):
+        return "DocF2FCounts(pages={}, f2f_pages={}, f2f_value_sum={}, dicthits={})".format(
+            self.pages, self.f2f_pages, self.f2f_value_sum, self.dicthits)
+
+    def __eq__(self, other):
+        return (isinstance(other, DocF2FCounts) and self.pages == other.pages and
+                self.f2f_pages == other.f2f_pages and self.dicthits == other.dicthits and
+                abs(self.f2f_value_sum - other.f2f_value_sum) < 1e-9)
+
+    def add_page(self, is_f2f, f2f_value):
+        self.pages += 1
+        self.f2f_pages += is_f2f
+        self.f2f_value_sum += f2f_value
+
+    def merge(self, other):
+        self.pages += other.pages
+        self.f2f_pages += other.f2f_pages
+        self.f2f_value_sum += other.f2f_value_sum
+        self.dicthits.update(other.dicthits)
+
+    @property
+    def f2f_fraction(self):
+        # no pages means no f2f pages, use 1 to avoid DBZ
+        return self.f2f_pages / max(self.pages, 1)
+
+    @property
+    def mean_f2f_value(self):
+        return self.f2f_value_sum / max(self.pages, 1)
+
+
+def f2f_fraction_policy(threshold=.5):
+    ''' is_f2f for DocF2FCounts, f2f when at least threshold of the pages are f2f '''
+    def is_f2f(doc_counts):
+        return doc_counts.f2f_fraction >= threshold
+    return is_f2f
+
+
+def f2f_probability_policy(threshold=.5):
+    ''' is_f2f for DocF2FCounts, f2f when the mean improved_f2f_value is at least threshold '''
+    def is_f2f(doc_counts):
+        return doc_counts.mean_f2f_value >= threshold
+    return is_f2f
+
+
+def f2f_roc(docs, labels, thresholds=None, score='mean_f2f_value'):
+    '''
+    ROC points for picking an f2f threshold
+
+    docs       - doc_uuid -> DocF2FCounts, from read_signal_file(..., counts=True)
+    labels     - doc_uuid -> True/False, the known f2f answer, docs without a label are skipped
+    thresholds - thresholds to try, default 0, .05, ... 1
+    score      - 'mean_f2f_value' or 'f2f_fraction'
+
+    returns a DataFrame of threshold, tpr, fpr
+    '''
+    import numpy as np
+
+    uuids = [u for u in docs if u in labels]
+    scores = np.array([getattr(docs[u], score) for u in uuids], dtype=np.float64)
+    truth = np.array([bool(labels[u]) for u in uuids])
+    if thresholds is None:
+        thresholds = np.linspace(0, 1, 21)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+
+    called = scores[:, None] >= thresholds[None, :]
+    positives = max(truth.sum(), 1)
+    negatives = max((~truth).sum(), 1)
+    return pd.DataFrame({'threshold': thresholds,
+                         'tpr': (called & truth[:, None]).sum(axis=0) / positives,
+                         'fpr': (called & ~truth[:, None]).sum(axis=0) / negatives})
+
+
 def _is_f2f(doc_signals):
+    if isinstance(doc_signals, DocF2FCounts):
+        return doc_signals.f2f_fraction >= .5
     # simple metric for now, if half or greater of the pages are f2f... just a swag
     # if this is zero, then f2fs will be zero, so we will set to 1 to avoide DBZ
     pg_count = max(len(doc_signals.f2f), 1) 
@@ -54,8 +181,22 @@ def _is_f2f(doc_signals):
     return f2f_count / pg_count >= .5 
 
 
+# this version of doc signals object will not care about pages or windows
+DocSignals = namedtuple("DocSignals", "f2f dicthits")
+
+
+def _write_f2f_summary(docs, summary_filename, is_f2f):
+    if not summary_filename:
+        return
+    with open(summary_filename, 'w') as dsum:
+        writer = csv.writer(dsum)
+        for uuid, doc_signals in docs.items():
+            if is_f2f(doc_signals):
+                writer.writerow([uuid, '|'.join(doc_signals.dicthits)])
+
+
 # JOS why did the is_f2f cause a "str not callable" error
-def read_signal_file(signal_filename, summary_filename=None, is_f2f=_is_f2f):
+def read_signal_file(signal_filename, summary_filename=None, is_f2f=_is_f2f, counts=False):
     '''
     parse a Madhu format signal file 
     @ signal_filename - input csv file
@@ -66,63 +207,356 @@ def read_signal_file(signal_filename, summary_filename=None, is_f2f=_is_f2f):
     return map of documents and their signals. if summary_filename is 
     supplied this function will write a csv file for all the F2F positive
     lines 
+    @ counts - map documents to DocF2FCounts running totals instead of DocSignals
+      with a list of per page booleans, use the f2f_*_policy() functions for is_f2f
     '''
-    # this version of doc signals object will not care about pages or windows
-    DocSignals = namedtuple("DocSignals", "f2f dicthits")
+    new_doc, parse = (DocF2FCounts, _parse_record_counts) if counts else (lambda: DocSignals([], set()), _parse_record)
     docs = {}
     with open(signal_filename) as sigs:
         reader = csv.DictReader(sigs, fieldnames=fieldnames)
         for r in reader:
             uuid = r['doc_uuid']
             if uuid not in docs:
-                docs[uuid] = DocSignals([], set())
-            _parse_record(r, docs[uuid])
+                docs[uuid] = new_doc()
+            parse(r, docs[uuid])
 
-    with open(summary_filename, 'w') as dsum:
-        writer = csv.writer(dsum)
-        for uuid, doc_signals in docs.items():
-            if is_f2f(doc_signals):
-                writer.writerow([uuid, '|'.join(doc_signals.dicthits)])
+    _write_f2f_summary(docs, summary_filename, is_f2f)
+    return docs
+
+
+def _aggregate_signal_chunk(chunk, partial, counts=False):
+    '''
+    the _parse_record rules for a whole DataFrame chunk at once, folded into partial
+    partial is (doc order, {doc: [f2f bools]} or {doc: DocF2FCounts}, {doc: dict hit set})
+    '''
+    order, f2f, dicthits = partial
+    has_f2f = chunk['improved_f2f'] != ''
+    is_hit = ~has_f2f & chunk['hcc_dict'].str.startswith('V22')
+
+    f2f_rows = chunk.loc[has_f2f, ['doc_uuid', 'improved_f2f', 'improved_f2f_value']]
+    f2f_rows = f2f_rows.assign(f2f=f2f_rows['improved_f2f'] == 'true')
+    if counts:
+        values = pd.to_numeric(f2f_rows['improved_f2f_value'], errors='coerce')
+        f2f_rows = f2f_rows.assign(value=values.fillna(f2f_rows['f2f'].astype(float)))
+        totals = f2f_rows.groupby('doc_uuid', sort=False).agg(
+            pages=('f2f', 'size'), f2f_pages=('f2f', 'sum'), f2f_value_sum=('value', 'sum'))
+        for uuid, pages, f2f_pages, f2f_value_sum in totals.itertuples():
+            f2f.setdefault(uuid, DocF2FCounts()).merge(
+                DocF2FCounts(int(pages), int(f2f_pages), float(f2f_value_sum)))
+    else:
+        for uuid, values in f2f_rows.groupby('doc_uuid', sort=False)['f2f'].agg(list).items():
+            f2f.setdefault(uuid, []).extend(values)
+    for uuid, hits in chunk[is_hit].groupby('doc_uuid', sort=False)['hcc_dict'].agg(set).items():
+        dicthits.setdefault(uuid, set()).update(hits)
+    order.extend(chunk['doc_uuid'].unique())
+
+
+def _read_signal_file_partial(args):
+    signal_filename, chunksize, counts = args
+    partial = ([], {}, {})
+    chunks = pd.read_csv(signal_filename, header=None, names=fieldnames, dtype=str,
+                         keep_default_na=False, chunksize=chunksize)
+    for chunk in chunks:
+        _aggregate_signal_chunk(chunk.fillna(''), partial, counts)
+    return partial
+
+
+def read_signal_files(signal_files, summary_filename=None, is_f2f=_is_f2f, chunksize=1000000,
+                      processes=None, counts=False):
+    '''
+    read_signal_file() for big inputs
+
+    @ signal_files - a glob pattern, a file name or a list of file names
+    @ summary_filename - as read_signal_file()
+    @ is_f2f - as read_signal_file()
+    @ chunksize - rows per pandas chunk, each chunk is aggregated with groupby
+    @ processes - with more than one file, read them in a pool of this many
+      processes, None for one per core, 1 to stay in this process
+    @ counts - as read_signal_file(), DocF2FCounts instead of DocSignals
+
+    returns the same map of doc_uuid -> DocSignals (or DocF2FCounts) as read_signal_file()
+    '''
+    import glob
+
+    if isinstance(signal_files, str):
+        signal_files = sorted(glob.glob(signal_files)) or [signal_files]
+    tasks = [(f, chunksize, counts) for f in signal_files]
+    if len(tasks) > 1 and processes != 1:
+        from multiprocessing import Pool
+        with Pool(processes) as pool:
+            partials = pool.map(_read_signal_file_partial, tasks)
+    else:
+        partials = [_read_signal_file_partial(t) for t in tasks]
 
+    docs = {}
+    for order, f2f, dicthits in partials:
+        for uuid in order:
+            if counts:
+                doc_signals = docs.setdefault(uuid, DocF2FCounts())
+                doc_signals.merge(f2f.pop(uuid, DocF2FCounts()))
+            else:
+                doc_signals = docs.setdefault(uuid, DocSignals([], set()))
+                doc_signals.f2f.extend(f2f.pop(uuid, []))
+            doc_signals.dicthits.update(dicthits.pop(uuid, ()))
+
+    _write_f2f_summary(docs, summary_filename, is_f2f)
     return docs
 
 
 ## header for CSV outputs generated from JSON inputs
-ref_header = ["pat_uuid", "doc_uuid", "sig_type", "source_val_type", 
-              "source_location", "start_page", "end_page", "value", "wt"]
+ref_header = SignalBatch.header
     
-def create_signal_table_from_ref(signals, output_file_name):
-    def write_row(signal):
-        signal = Signal(signal)
-        sig_writer.writerow(
-            [signal.pat_uuid, signal.doc_uuid, signal.name, signal.source_type, 
-             signal.source_value, signal.source_start_page, 
-             signal.source_end_page, signal.value, signal.weight])
+## json backends
+## the json lines reader and the smas json writer use the fastest json library
+## installed, orjson, then simdjson (decode only), then ujson, falling back to the
+## stdlib. array and ref dumps always go through the stdlib raw_decode since the
+## fast libraries can not decode a value out of the middle of a buffer
+class _JsonBackend(object):
+    '''
+    name  - library name
+    loads - str or bytes -> object
+    dumps - object -> utf-8 bytes, no trailing newline
+    '''
+    def __init__(self, name, loads, dumps):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj).encode('utf-8')
+
+
+def _load_json_backend(name):
+    if name == 'json':
+        return _JsonBackend('json', json.loads, _stdlib_dumps)
+    if name == 'orjson':
+        import orjson
+
+        def dumps(obj):
+            try:
+                return orjson.dumps(obj)
+            except TypeError:
+                # big ints and non str keys, orjson won't do them
+                return _stdlib_dumps(obj)
+        return _JsonBackend('orjson', orjson.loads, dumps)
+    if name == 'simdjson':
+        import simdjson
+        return _JsonBackend('simdjson', simdjson.loads, _stdlib_dumps)
+    if name == 'ujson':
+        import ujson
+        return _JsonBackend('ujson', ujson.loads,
+                            lambda obj: ujson.dumps(obj, ensure_ascii=False).encode('utf-8'))
+    raise ValueError(f"unknown json backend {name}")
+
+
+_json_backend_names = ['orjson', 'simdjson', 'ujson', 'json']
+
+def available_json_backends():
+    ''' names of the json backends that import here, fastest first '''
+    available = []
+    for name in _json_backend_names:
+        try:
+            _load_json_backend(name)
+            available.append(name)
+        except ImportError:
+            pass
+    return available
+
+
+def _fastest_json_backend():
+    # stops at the first one that imports, the slower candidates are never imported
+    for name in _json_backend_names:
+        try:
+            return _load_json_backend(name)
+        except ImportError:
+            pass
+
+
+# picked on first use so importing this module doesn't import every json library
+_json_backend = None
+
+def _current_json_backend():
+    global _json_backend
+    if _json_backend is None:
+        _json_backend = _fastest_json_backend()
+    return _json_backend
+
+
+def set_json_backend(name=None):
+    ''' pick the json backend by name, None picks the fastest one installed '''
+    global _json_backend
+    _json_backend = _load_json_backend(name) if name else _fastest_json_backend()
+    return _json_backend.name
+
+
+def get_json_backend():
+    return _current_json_backend().name
+
+
+def _is_signal(obj):
+    return isinstance(obj, dict) and 'name' in obj
+
+
+def _iter_smas_stream(stream):
+    # SigGen writes either one signal per line or a single top level array
+    if stream.peek() == '[':
+        for _ in stream.array_items():
+            offset = stream.offset()
+            sig = stream.value()
+            if _is_signal(sig):
+                yield offset, sig
+    else:
+        while stream.peek() != '':
+            offset = stream.offset()
+            sig = stream.value()
+            if _is_signal(sig):
+                yield offset, sig
+
+
+def _iter_ref_stream(stream):
+    # ref dumps are {..., "signals": [type_name, [signal, signal, ...]], ...}
+    for key in stream.object_keys():
+        if key != 'signals':
+            stream.value()
+            continue
+        for _ in stream.array_items():
+            if stream.peek() != '[':
+                stream.value()
+                continue
+            for _ in stream.array_items():
+                offset = stream.offset()
+                sig = stream.value()
+                if _is_signal(sig):
+                    yield offset, sig
+
 
+def _iter_json_lines(dump, loads):
+    # one signal per line, offsets are free here so we always count them
+    offset = 0
+    for line in dump:
+        if line.strip():
+            sig = loads(line)
+            if _is_signal(sig):
+                # point at the record itself, not the indentation in front of it
+                yield offset + (len(line) - len(line.lstrip())), sig
+        offset += len(line)
+
+
+def _first_char(file_name):
+    with open(file_name, 'rb') as dump:
+        while True:
+            chunk = dump.read(4096)
+            if not chunk:
+                return ''
+            chunk = chunk.lstrip()
+            if chunk:
+                return chunk[:1].decode('ascii', errors='replace')
+
+
+def _iter_dump(signals_file_name, fmt, track_offsets=False):
+    walkers = {'smas': _iter_smas_stream, 'ref': _iter_ref_stream}
+    if fmt not in walkers:
+        raise ValueError(f"iter_raw_signals: fmt must be 'smas' or 'ref', got {fmt}")
+    if fmt == 'smas' and _first_char(signals_file_name) != '[':
+        with open(signals_file_name, 'rb') as sigs:
+            yield from _iter_json_lines(sigs, _current_json_backend().loads)
+        return
+    # newline='' so \r\n reaches us as is, offsets count the bytes actually in the file
+    with open(signals_file_name, encoding='utf-8', newline='') as sigs:
+        yield from walkers[fmt](JsonStream(sigs, track_offsets=track_offsets))
+
+
+def iter_raw_signals(signals_file_name, fmt='smas'):
+    '''
+    generator over the raw json signal dicts in a signal dump, one at a time
+
+    signals_file_name - SMAS or reference signal dump
+    fmt - 'smas' for SigGen dumps, either json lines or a top level array
+          'ref' for reference algorithm dumps
+
+    the file is never loaded whole, so this is safe for multi-GB dumps
+    '''
+    for _, sig in _iter_dump(signals_file_name, fmt):
+        yield sig
+
+
+def iter_signals(signals_file_name, fmt='smas', debug=False):
+    '''
+    same as iter_raw_signals() but yields Signal objects
+
+    debug - give each Signal a RawSignalRef to its record in the dump, so
+      signal_object still works without every raw signal being held in memory
+    '''
+    for offset, sig in _iter_dump(signals_file_name, fmt, track_offsets=debug):
+        yield Signal(sig, raw_ref=RawSignalRef(signals_file_name, offset) if debug else None)
+
+
+def _ref_signal_dicts(ref_sigs):
+    # same walk as parse('signals[*][*].name') over an already loaded ref dump
+    for group in ref_sigs.get('signals', []):
+        if isinstance(group, list):
+            for sig in group:
+                if _is_signal(sig):
+                    yield sig
+
+
+def write_signal_table(signals, output_file_name):
+    '''
+    write Signals out as a csv table with the ref_header columns
+
+    signals - any iterable of Signal objects, hand it a generator like
+      iter_signals() and only one signal is in memory at a time
+    '''
     with open(output_file_name, 'w') as sigout:
         sig_writer = csv.writer(sigout)
-        sig_parser = parse('signals[*][*].name')
-        sig_list = [match for match in sig_parser.find(signals)]
         sig_writer.writerow(ref_header)
-        [write_row(c) for c in [m.context.value for m in sig_list]]
+        for signal in signals:
+            sig_writer.writerow(
+                [signal.pat_uuid, signal.doc_uuid, signal.name, signal.source_type, 
+                 signal.source_value, signal.source_start_page, 
+                 signal.source_end_page, signal.value, signal.weight])
 
 
-def create_signal_table_from_smas(signals, output_file_name):
-    def write_row(signal):
-        signal = Signal(signal)
-        sig_writer.writerow(
-            [signal.pat_uuid, signal.doc_uuid, signal.name, signal.source_type, 
-             signal.source_value, signal.source_start_page, 
-             signal.source_end_page, signal.value, signal.weight])
-
+def write_signal_batches(raw_signals, output_file_name, batch_size=100000):
+    '''
+    same table as write_signal_table() but straight from raw json signals, they are
+    decoded batch_size at a time into SignalBatch columns so no Signal objects are built
+    '''
     with open(output_file_name, 'w') as sigout:
-        sig_writer = csv.writer(sigout)
-        sig_parser = parse('[*].name')
-        sig_list = [match for match in sig_parser.find(signals)]
+        csv.writer(sigout).writerow(ref_header)
+        for batch in iter_signal_batches(raw_signals, batch_size):
+            batch.to_csv(sigout, header=False)
 
-        '''pat_id, doc_id, sig_type, source_val_type, source_location, value, wt'''
-        sig_writer.writerow(ref_header)
-        [write_row(c) for c in [m.context.value for m in sig_list]]
+
+_write_batch_size = 10000
+
+def write_smas_json(signals, output_file_name, batch_size=_write_batch_size):
+    '''
+    write Signals out SMAS style, one json signal per line
+    lines are encoded with the current json backend and written batch_size at a time
+    '''
+    dumps = _current_json_backend().dumps
+    with open(output_file_name, 'wb') as sigout:
+        lines = []
+        for signal in signals:
+            lines.append(dumps(signal.to_smas_json()))
+            if len(lines) >= batch_size:
+                lines.append(b'')
+                sigout.write(b'\n'.join(lines))
+                lines = []
+        if lines:
+            lines.append(b'')
+            sigout.write(b'\n'.join(lines))
+
+    
+def create_signal_table_from_ref(signals, output_file_name):
+    write_signal_batches(_ref_signal_dicts(signals), output_file_name)
+
+
+def create_signal_table_from_smas(signals, output_file_name):
+    '''pat_id, doc_id, sig_type, source_val_type, source_location, value, wt'''
+    write_signal_batches((s for s in signals if _is_signal(s)), output_file_name)
 
 ## jos check to see if this is in our library
 def make_timestamp():
@@ -145,75 +579,70 @@ def make_filename(base, ext="", working_directory=working_directory, timestamp=t
 
     
 def convert_json_signal_input_to_csv(reference_signals_file_name, smas_signals_file_name):
-    with open(reference_signals_file_name) as ref, open(smas_signals_file_name) as smas:
-        ref_sigs = json.load(ref)
-        smas_sigs = json.load(smas)
-
     ref_csv_filename = make_filename("ref-sigs", "csv")
     smas_csv_filename = make_filename("smas-sigs", "csv")
 
-    create_signal_table_from_ref(ref_sigs, ref_csv_filename)
-    create_signal_table_from_smas(smas_sigs, smas_csv_filename)
+    write_signal_batches(iter_raw_signals(reference_signals_file_name, 'ref'), ref_csv_filename)
+    write_signal_batches(iter_raw_signals(smas_signals_file_name, 'smas'), smas_csv_filename)
 
     return ref_csv_filename, smas_csv_filename
 
 
 def smas_json_to_csv(reference_signals_file_name, smas_signals_file_name):
-    ''' this is NOT DONE yet, we need to accomodate both the line by line and the array'''
-    with open(smas_signals_file_name) as smas:
-        smas_sigs = json.load(smas)
-
+    ''' handles both the line by line and the array form of the SMAS dump '''
     smas_csv_filename = make_filename("smas-sigs", "csv")
-    create_signal_table_from_smas(smas_sigs, smas_csv_filename)
+    write_signal_batches(iter_raw_signals(smas_signals_file_name, 'smas'), smas_csv_filename)
 
     return smas_csv_filename
 
 
+# how many signals ref_json_to_csv() reads looking for one that names the patient and document
+_ref_source_lookahead = 1000
+
 def ref_json_to_csv(reference_signals_file_name, filename_generator=make_filename):
-    with open(reference_signals_file_name) as ref:
-        ref_sigs = json.load(ref)
-
-    # lets reuse the name we were sent
-    #basename = path.splitext(reference_signals_file_name)[0]
-    def make_filename(ref_sigs):
-        # use pat_uuid:doc_uuid-ref format filename
-        for sig in ref_sigs['signals'][1]:
-            try:
-                source = sig['source'][1]
-                doc = source['documentId']['uuid']
-                pat = source['patientId']['uuid']
-                return filename_generator(f"{pat}:{doc}-ref", "csv", timestamp=None)
-            except:
-                print(f"bad source: {source}")
-
-    ref_csv_filename = make_filename(ref_sigs)
+    ref_sigs = iter_raw_signals(reference_signals_file_name, 'ref')
+
+    # use pat_uuid:doc_uuid-ref format filename from the first signal that has them,
+    # anything we read on the way is held and written first. only the first
+    # _ref_source_lookahead signals are looked at so a dump with no usable source
+    # doesn't end up in memory
+    seen = []
+    ref_csv_filename = None
+    for sig in itertools.islice(ref_sigs, _ref_source_lookahead):
+        seen.append(sig)
+        try:
+            source = sig['source'][1]
+            doc = source['documentId']['uuid']
+            pat = source['patientId']['uuid']
+            ref_csv_filename = filename_generator(f"{pat}:{doc}-ref", "csv", timestamp=None)
+            break
+        except (KeyError, IndexError, TypeError):
+            print(f"bad source: {sig.get('source')}")
+
+    if ref_csv_filename is None:
+        raise ValueError(f"ref_json_to_csv: none of the first {len(seen)} signals in {reference_signals_file_name} "
+                         "has a source with a documentId and patientId to name the csv file after")
     print(f"doing file {ref_csv_filename}")
-    create_signal_table_from_ref(ref_sigs, ref_csv_filename)
+    write_signal_batches(itertools.chain(seen, ref_sigs), ref_csv_filename)
+    return ref_csv_filename
 
 
-def ref_json_to_smas_json(reference_signals_file_name, filename_generator=make_filename):
+def ref_json_to_smas_json(reference_signals_file_name, filename_generator=make_filename,
+                          smas_version_filename=None):
     '''
     convert a Reference Signal dump to a SMAS signal dump which contains json signals 
     one per line
-    '''
-    def write_row(signal):
-        '''
-        write a json 'row' representation of the signal
 
-        signal: a ref json subobject to be used to construct a Signal object
-        '''
-        signal = Signal(signal)
-        print(json.dumps(signal.to_smas_json()), file=sigout)
-                     
-    #basename = path.splitext(reference_signals_file_name)[0]
-    #ref_csv_filename = filename_generator(basename, "csv")
-    smas_version_filename = '/Users/jos/Downloads/SMAS-SIGS/foopy.json'
+    smas_version_filename - where to write it, by default the reference file's name with
+      -smas added, from filename_generator
 
-    with open(reference_signals_file_name) as ref, open(smas_version_filename, 'w') as sigout:
-        ref_sigs = json.load(ref)
-        sig_parser = parse('signals[*][*].name')
-        sig_list = [match for match in sig_parser.find(ref_sigs)]
-        [write_row(c) for c in [m.context.value for m in sig_list]]
+    returns the SMAS file name
+    '''
+    if smas_version_filename is None:
+        base = os.path.splitext(os.path.basename(reference_signals_file_name))[0]
+        smas_version_filename = filename_generator(f"{base}-smas", "json")
+    write_smas_json(iter_signals(reference_signals_file_name, 'ref'), smas_version_filename)
+    return smas_version_filename
 
 
 def diff_csv_files(ref_csv_filename, smas_csv_filename):
@@ -262,19 +691,544 @@ def diff_csv_files(ref_csv_filename, smas_csv_filename):
             sig_writer.writerow(s)        
             
 
+def _shard_key_reader(csv_filename):
+    # rows as tuples in ref_header order whatever order the file has its columns in
+    with open(csv_filename, newline='') as sigfile:
+        reader = csv.reader(sigfile)
+        header = next(reader, None)
+        if header is None:
+            return
+        columns = [header.index(c) for c in ref_header]
+        for row in reader:
+            yield tuple(row[c] for c in columns)
+
+
+def _partition_csv(csv_filename, shard_filenames):
+    ''' hash partition a signal csv by (pat_uuid, doc_uuid) into the shard files '''
+    files = [open(f, 'w', newline='') for f in shard_filenames]
+    try:
+        writers = [csv.writer(f) for f in files]
+        shards = len(writers)
+        for row in _shard_key_reader(csv_filename):
+            key = f"{row[0]}\t{row[1]}".encode('utf-8')
+            writers[zlib.crc32(key) % shards].writerow(row)
+    finally:
+        for f in files:
+            f.close()
+
+
+def _diff_shard(args):
+    '''
+    diff one pair of shards, same rules as diff_csv_files(), headerless outputs
+    go to the out_filenames and the counts come back
+    '''
+    shard, ref_shard, smas_shard, (extra_filename, missing_filename, dupes_filename) = args
+    with open(smas_shard, newline='') as sigfile, open(dupes_filename, 'w', newline='') as dupfile:
+        sig_writer = csv.writer(dupfile)
+        smas_sigs = set()
+        duplicates = 0
+        for row in csv.reader(sigfile):
+            signal = tuple(row)
+            if signal in smas_sigs:
+                sig_writer.writerow(signal)
+                duplicates += 1
+            else:
+                smas_sigs.add(signal)
+
+    with open(ref_shard, newline='') as sigfile:
+        ref_sigs = set(tuple(row) for row in csv.reader(sigfile))
+
+    extra_smas_sigs = smas_sigs - ref_sigs
+    missing_smas_sigs = ref_sigs - smas_sigs
+    for filename, sigs in ((extra_filename, extra_smas_sigs), (missing_filename, missing_smas_sigs)):
+        with open(filename, 'w', newline='') as sigfile:
+            csv.writer(sigfile).writerows(sigs)
+
+    return {'shard': shard, 'smas': len(smas_sigs), 'ref': len(ref_sigs),
+            'intersection': len(smas_sigs) - len(extra_smas_sigs),
+            'extra': len(extra_smas_sigs), 'missing': len(missing_smas_sigs),
+            'duplicates': duplicates}
+
+
+def diff_csv_files_sharded(ref_csv_filename, smas_csv_filename, shards=64, processes=None,
+                           shard_directory=None):
+    '''
+    diff_csv_files() for inputs bigger than memory
+
+    both csv files are hash partitioned on (pat_uuid, doc_uuid) into shards on disk,
+    a signal can only match a signal in the same shard, and the shard pairs are
+    diffed in a process pool. only one shard pair per worker is ever in memory
+
+    shards          - number of partitions, pick it so a shard fits in a worker's memory
+    processes       - pool size, None for one per core
+    shard_directory - where the shards go, a temp dir by default, they are removed after
+
+    writes the same smas extra / missing / duplicate files as diff_csv_files() and
+    returns the list of per shard counts
+    '''
+    import shutil
+    import tempfile
+    from multiprocessing import Pool
+
+    outputs = {'extra': make_filename("smas-extra-sigs", "csv"),
+               'missing': make_filename("smas-missing_sigs", "csv"),
+               'duplicates': make_filename("smas-duplicate-sigs", "csv")}
+
+    with tempfile.TemporaryDirectory(dir=shard_directory) as tmp:
+        def shard_names(kind):
+            return [os.path.join(tmp, f"{kind}-{i:05}.csv") for i in range(shards)]
+
+        ref_shards, smas_shards = shard_names('ref'), shard_names('smas')
+        _partition_csv(ref_csv_filename, ref_shards)
+        _partition_csv(smas_csv_filename, smas_shards)
+
+        out_shards = list(zip(shard_names('extra'), shard_names('missing'), shard_names('duplicates')))
+        with Pool(processes) as pool:
+            counts = pool.map(_diff_shard, zip(range(shards), ref_shards, smas_shards, out_shards))
+
+        for i, kind in enumerate(['extra', 'missing', 'duplicates']):
+            with open(outputs[kind], 'w', newline='') as out:
+                csv.writer(out).writerow(ref_header)
+                for shard_files in out_shards:
+                    with open(shard_files[i], newline='') as shard_file:
+                        shutil.copyfileobj(shard_file, out)
+
+    totals = {k: sum(c[k] for c in counts) for k in ['smas', 'ref', 'intersection', 'extra', 'missing', 'duplicates']}
+    print(f"number of unique smas-sigs = {totals['smas']}\nnumber of unique ref-sigs = {totals['ref']}")
+    print(f"intersection size = {totals['intersection']}")
+    print(f"SMAS has {totals['extra']} extra and {totals['missing']} missing sigs, {totals['duplicates']} duplicates")
+    return counts
+
+
+def read_signal_frame(signals_file_name, fmt='smas', batch_size=100000):
+    '''
+    parse a signal dump once straight into a DataFrame with the csv table columns
+    pat_uuid, doc_uuid, sig_type and source_val_type come back as categoricals
+    '''
+    batches = list(iter_signal_batches(iter_raw_signals(signals_file_name, fmt), batch_size))
+    return SignalBatch.concat(batches).to_dataframe()
+
+
+def _csv_field(value):
+    # the text csv.writer puts in a field, None is an empty field
+    return '' if value is None else str(value)
+
+
+def _diff_key_frame(df):
+    # compare every non numeric column as the text the csv tables would have, so a
+    # wt of 1 and one of 1.0 differ here like they do there, and lists and dicts hash
+    key = df.copy(deep=False)
+    for column in key.columns:
+        values = key[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # each category once, the codes pick the text, -1 (missing) lands on ''
+            text = pd.Series([_csv_field(c) for c in values.cat.categories] + [''], dtype=object)
+            key[column] = text.to_numpy()[values.cat.codes.to_numpy()]
+        elif values.dtype == object:
+            key[column] = [_csv_field(v) for v in values.tolist()]
+    return key
+
+
+def diff_signal_frames(ref_df, smas_df, write_csv=False):
+    '''
+    diff_csv_files() on signal DataFrames, a drop_duplicates plus an outer merge
+    with indicator instead of Python sets
+
+    write_csv - also write the smas extra / missing / duplicate csv files
+
+    returns the extra, missing and duplicate smas signals as DataFrames
+    '''
+    ref_key = _diff_key_frame(ref_df)
+    smas_key = _diff_key_frame(smas_df)
+
+    dupe_mask = smas_key.duplicated(keep='first')
+    duplicates = smas_df[dupe_mask]
+    smas_unique = smas_key[~dupe_mask]
+    ref_unique = ref_key.drop_duplicates()
+
+    print(f"number of unique smas-sigs = {len(smas_unique)}\nnumber of unique ref-sigs = {len(ref_unique)}")
+    merged = smas_unique.merge(ref_unique, how='outer', on=ref_header, indicator=True)
+    print(f"intersection size = {(merged['_merge'] == 'both').sum()}")
+
+    extra_smas_sigs = merged.loc[merged['_merge'] == 'left_only', ref_header]
+    missing_smas_sigs = merged.loc[merged['_merge'] == 'right_only', ref_header]
+    print(f"SMAS has {len(extra_smas_sigs)} extra and {len(missing_smas_sigs)} missing sigs")
+
+    if write_csv:
+        duplicates.to_csv(make_filename("smas-duplicate-sigs", "csv"), index=False)
+        extra_smas_sigs.to_csv(make_filename("smas-extra-sigs", "csv"), index=False)
+        missing_smas_sigs.to_csv(make_filename("smas-missing_sigs", "csv"), index=False)
+
+    return extra_smas_sigs, missing_smas_sigs, duplicates
+
+
 ## this is the driver program
 ##   convert json to csv
 ##   
-def compare_smas_and_reference_signals(reference_signals_file_name, smas_signals_file_name):
-    ref_csv_filename, smas_csv_filename = convert_json_signal_input_to_csv(reference_signals_file_name,
-                                                                           smas_signals_file_name)
-    smas_df = pd.read_csv(smas_csv_filename)
-    ref_df = pd.read_csv(ref_csv_filename)
+def compare_smas_and_reference_signals(reference_signals_file_name, smas_signals_file_name,
+                                       in_memory=False, write_csv=True):
+    '''
+    summarize and diff a reference and a SMAS signal dump
+
+    in_memory - parse each dump once into a DataFrame and do the summaries and the
+      diff off those frames, skipping the json -> csv -> DataFrame round trip
+    write_csv - in_memory only, write the signal tables and diff outputs as csv too
+
+    in_memory returns the (extra, missing, duplicates) DataFrames from diff_signal_frames()
+    '''
+    if in_memory:
+        ref_df = read_signal_frame(reference_signals_file_name, 'ref')
+        smas_df = read_signal_frame(smas_signals_file_name, 'smas')
+        if write_csv:
+            ref_df.to_csv(make_filename("ref-sigs", "csv"), index=False)
+            smas_df.to_csv(make_filename("smas-sigs", "csv"), index=False)
+    else:
+        ref_csv_filename, smas_csv_filename = convert_json_signal_input_to_csv(reference_signals_file_name,
+                                                                               smas_signals_file_name)
+        smas_df = pd.read_csv(smas_csv_filename)
+        ref_df = pd.read_csv(ref_csv_filename)
+
     print('SMAS results')
-    print(smas_df[['source_val_type', 'sig_type']].groupby(['source_val_type']).describe())
+    print(smas_df[['source_val_type', 'sig_type']].groupby(['source_val_type'], observed=True).describe())
     print('REF results')
-    print(ref_df[['source_val_type', 'sig_type']].groupby(['source_val_type']).describe())
+    print(ref_df[['source_val_type', 'sig_type']].groupby(['source_val_type'], observed=True).describe())
 
+    if in_memory:
+        return diff_signal_frames(ref_df, smas_df, write_csv)
     diff_csv_files(ref_csv_filename, smas_csv_filename)
     
-    
\ No newline at end of file
+
+def _synthetic_smas_signal(i):
+    return {'name': f'V22_{i % 79}', 'sigType': 'NUMERIC', 'value': [1, (i % 97) / 97.0],
+            'source': {'page': i % 300, 'doc': {'uuid': f'0f8fad5b-d9cb-469f-a165-7086{i % 500:08d}'},
+                       'pat': {'uuid': f'7c9e6679-7425-40de-944b-e07f{i % 50:08d}'}},
+            'generator': {'className': 'com.apixio.DictionaryGenerator', 'version': '1.0.3'},
+            'wt': 1.0}
+
+
+def benchmark_json_backends(n_signals=200000, working_directory=None):
+    '''
+    benchmark, signals/sec reading a synthetic json lines SMAS dump and writing it
+    back out with write_smas_json(), for every json backend installed here
+
+    returns {backend: {'read': signals/sec, 'write': signals/sec}}
+    '''
+    import tempfile
+    import time
+
+    current = get_json_backend()
+    results = {}
+    with tempfile.TemporaryDirectory(dir=working_directory) as tmp:
+        dump_file = os.path.join(tmp, 'smas.json')
+        with open(dump_file, 'w') as dump:
+            for i in range(n_signals):
+                print(json.dumps(_synthetic_smas_signal(i)), file=dump)
+        signals = list(iter_signals(dump_file))
+        try:
+            for name in available_json_backends():
+                set_json_backend(name)
+                start = time.perf_counter()
+                for _ in iter_raw_signals(dump_file):
+                    pass
+                read_secs = time.perf_counter() - start
+
+                start = time.perf_counter()
+                write_smas_json(signals, os.path.join(tmp, f'{name}.json'))
+                write_secs = time.perf_counter() - start
+
+                results[name] = {'read': n_signals / read_secs, 'write': n_signals / write_secs}
+                print(f"{name:>8}: read {results[name]['read']:,.0f} sigs/sec, "
+                      f"write {results[name]['write']:,.0f} sigs/sec")
+        finally:
+            set_json_backend(current)
+    return results
+
+
+class _DictSignal(object):
+    '''
+    the Signal layout from before __slots__, a __dict__ per signal holding the source
+    and generator objects and uninterned strings. only here so measure_signal_memory()
+    has a before to compare with
+    '''
+    def __init__(self, signal, debug=False):
+        signal_source, source_name, source, generator_name, generator = _unpack(signal)
+        source_type, source_key, doc_uuid, pat_uuid = _source_fields(source)
+        self._signal_source = signal_source
+        self._source_name = source_name
+        self._source = source
+        self._generator_name = generator_name
+        self._generator = generator
+        self._source_type = source_type
+        self._source_key = source_key
+        self._doc_uuid = doc_uuid
+        self._pat_uuid = pat_uuid
+        self._source_val = source[source_key] if source_key in source else -1
+        self._end_page = source['endPage'] if source_type == 'PageWindowSource' else -1
+        self._start_page = source['startPage'] if source_type == 'PageWindowSource' else -1
+        self._name = signal['name']
+        self._sig_type = signal['sigType']
+        self._value = signal['value']
+        self._weight = signal['wt']
+        if debug:
+            self._signal = signal
+
+
+def _bytes_per_signal(make, json_lines):
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        keep = [make(json.loads(line), i) for i, line in enumerate(json_lines)]
+        held, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return held / max(len(keep), 1)
+
+
+def measure_signal_memory(json_lines, debug=False):
+    '''
+    benchmark, bytes held per signal built from a list of json signal strings
+
+    the raw dicts are dropped as we go, like they are when streaming a dump, so
+    this is what a signal keeps alive. three ways of holding one
+      dict     - the old __dict__ Signal (_DictSignal), the before number
+      slots    - Signal as it is now
+      raw_ref  - Signal with a (fake) RawSignalRef the way iter_signals(debug=True)
+                 makes them, source and generator are read back from the dump
+
+    returns {layout: bytes per signal}
+    '''
+    json_lines = list(json_lines)
+    makers = {'dict': lambda sig, i: _DictSignal(sig, debug),
+              'slots': lambda sig, i: Signal(sig, debug),
+              'raw_ref': lambda sig, i: Signal(sig, debug, RawSignalRef('dump.json', i))}
+    results = {}
+    for layout, make in makers.items():
+        results[layout] = _bytes_per_signal(make, json_lines)
+        print(f"{layout:>8}: {results[layout]:,.0f} bytes/signal")
+    return results
+
+
+import unittest
+class TestRawSignalRefs(unittest.TestCase):
+    """
+    every RawSignalRef iter_signals(debug=True) hands out loads back its own record
+
+    > import unittest
+    > from joslib.signal.utils import TestRawSignalRefs
+    > unittest.main(argv=[''], verbosity=2, exit=False)
+    """
+    def _round_trip(self, text, fmt):
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            dump_file = os.path.join(tmp, 'dump.json')
+            with open(dump_file, 'w', encoding='utf-8', newline='') as dump:
+                dump.write(text)
+            raws = list(iter_raw_signals(dump_file, fmt))
+            refs = [sig.raw_ref for sig in iter_signals(dump_file, fmt, debug=True)]
+            self.assertEqual(len(raws), 3)
+            self.assertEqual([ref.load() for ref in refs], raws)
+
+    def _signals(self, non_ascii=False):
+        sigs = [_synthetic_smas_signal(i) for i in range(3)]
+        if non_ascii:
+            for sig in sigs:
+                sig['generator']['note'] = 'Müller – 糖尿病'
+        return sigs
+
+    def _ref_dump(self, sigs, newline):
+        ref_sigs = [dict(sig, source=['PageSource', sig['source']],
+                         generator=['DictionaryGenerator', sig['generator']]) for sig in sigs]
+        items = newline.join('    ' + json.dumps(sig, ensure_ascii=False) + ',' for sig in ref_sigs)[:-1]
+        return '{' + newline + '  "signals": [' + newline + '  "Signal", [' + newline + items + newline + ']]}' + newline
+
+    def test_smas_array_crlf(self):
+        sigs = self._signals()
+        self._round_trip('[\r\n' + ',\r\n'.join(json.dumps(sig) for sig in sigs) + '\r\n]\r\n', 'smas')
+
+    def test_ref_crlf(self):
+        self._round_trip(self._ref_dump(self._signals(), '\r\n'), 'ref')
+
+    def test_smas_array_non_ascii(self):
+        sigs = self._signals(non_ascii=True)
+        self._round_trip('[\n' + ',\n'.join(json.dumps(sig, ensure_ascii=False) for sig in sigs) + '\n]\n', 'smas')
+
+    def test_ref_non_ascii_crlf(self):
+        self._round_trip(self._ref_dump(self._signals(non_ascii=True), '\r\n'), 'ref')
+
+    def test_json_lines_crlf_non_ascii(self):
+        sigs = self._signals(non_ascii=True)
+        self._round_trip(''.join(json.dumps(sig, ensure_ascii=False) + '\r\n' for sig in sigs), 'smas')
+
+    def test_json_lines_indented(self):
+        sigs = self._signals(non_ascii=True)
+        self._round_trip(''.join('  \t' + json.dumps(sig, ensure_ascii=False) + '\n\n' for sig in sigs), 'smas')
+
+    def test_to_smas_json_loads_once(self):
+        import tempfile
+        from unittest import mock
+        sigs = self._signals()
+        with tempfile.TemporaryDirectory() as tmp:
+            dump_file = os.path.join(tmp, 'dump.json')
+            with open(dump_file, 'w', encoding='utf-8', newline='') as dump:
+                dump.write(self._ref_dump(sigs, '\n'))
+            held = [sig.to_smas_json() for sig in iter_signals(dump_file, 'ref')]
+            refs = list(iter_signals(dump_file, 'ref', debug=True))
+            with mock.patch.object(RawSignalRef, 'load', autospec=True, side_effect=RawSignalRef.load) as load:
+                from_refs = [sig.to_smas_json() for sig in refs]
+        self.assertEqual(load.call_count, len(sigs))
+        self.assertEqual(from_refs, held)
+
+    def test_load_skips_leading_whitespace(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            dump_file = os.path.join(tmp, 'dump.json')
+            with open(dump_file, 'w', encoding='utf-8', newline='') as dump:
+                dump.write('[ \r\n\t' + json.dumps(_synthetic_smas_signal(0)) + ']')
+            self.assertEqual(RawSignalRef(dump_file, 1).load(), _synthetic_smas_signal(0))
+
+
+class TestSignalTables(unittest.TestCase):
+    """ the batch writer and the Signal row writer agree byte for byte """
+
+    def _raw_signals(self):
+        sigs = [_synthetic_smas_signal(i) for i in range(6)]
+        sigs[1]['wt'] = 1
+        sigs[2]['wt'] = None
+        sigs[3]['source'] = {'centroid': 4, 'startPage': 3, 'endPage': 5,
+                             'documentId': {'uuid': 'd-1'}, 'patientId': {'uuid': 'p-1'}}
+        sigs[4]['value'] = 'some, text "quoted"'
+        # ref flavored
+        sigs[5] = dict(sigs[5], source=['PageSource', sigs[5]['source']],
+                       generator=['DictionaryGenerator', sigs[5]['generator']])
+        return sigs
+
+    def test_batches_match_signal_table(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            rows_file = os.path.join(tmp, 'rows.csv')
+            batch_file = os.path.join(tmp, 'batches.csv')
+            write_signal_table((Signal(sig) for sig in self._raw_signals()), rows_file)
+            write_signal_batches(self._raw_signals(), batch_file, batch_size=4)
+            with open(rows_file, 'rb') as rows, open(batch_file, 'rb') as batches:
+                self.assertEqual(batches.read(), rows.read())
+
+    def test_bad_signal_only_skips_itself(self):
+        sigs = self._raw_signals()
+        sigs[3]['source']['startPage'] = None
+        sigs[0]['wt'] = 'heavy'
+        batch = SignalBatch.from_raw(sigs)
+        self.assertEqual(len(batch), 4)
+        self.assertEqual([row[-1] for row in batch.rows()], [1, None, 1.0, 1.0])
+
+
+class TestDiffSignalFrames(unittest.TestCase):
+    """ the in memory diff counts what the csv diff counts """
+
+    def _dumps(self, tmp):
+        smas = [_synthetic_smas_signal(i) for i in range(40)]
+        ref = [_synthetic_smas_signal(i) for i in range(10, 50)]
+        for i, sig in enumerate(smas):
+            # the same weight written as an int in one dump and a float in the other
+            sig['wt'] = 1 if i % 3 == 0 else 1.0
+        for i, sig in enumerate(ref):
+            sig['wt'] = 1 if i % 2 == 0 else 1.0
+        # real duplicates, and one that only looks like a duplicate if 1 == 1.0
+        smas += smas[:7] + [dict(smas[0], wt=1.0)]
+        smas_file = os.path.join(tmp, 'smas.json')
+        with open(smas_file, 'w') as dump:
+            for sig in smas:
+                print(json.dumps(sig), file=dump)
+        ref_file = os.path.join(tmp, 'ref.json')
+        with open(ref_file, 'w') as dump:
+            ref = [dict(sig, source=['PageSource', sig['source']],
+                        generator=['DictionaryGenerator', sig['generator']]) for sig in ref]
+            json.dump({'signals': ['Signal', ref]}, dump)
+        return ref_file, smas_file
+
+    def test_in_memory_matches_csv(self):
+        import contextlib
+        import io
+        import tempfile
+        from unittest import mock
+
+        def count_rows(file_name):
+            with open(file_name, newline='') as f:
+                return sum(1 for _ in csv.reader(f)) - 1
+
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()), \
+                mock.patch(f'{__name__}.make_filename', lambda base, ext='', **kw: _make_filename(base, ext, tmp)):
+            ref_file, smas_file = self._dumps(tmp)
+            extra, missing, duplicates = compare_smas_and_reference_signals(ref_file, smas_file, in_memory=True,
+                                                                            write_csv=False)
+            compare_smas_and_reference_signals(ref_file, smas_file)
+            csv_counts = [count_rows(make_filename(name, 'csv'))
+                          for name in ('smas-extra-sigs', 'smas-missing_sigs', 'smas-duplicate-sigs')]
+        self.assertEqual([len(extra), len(missing), len(duplicates)], csv_counts)
+        # 1 vs 1.0 alone must make some of the overlapping signals differ
+        self.assertGreater(len(extra), 10)
+
+
+class TestReadSignalFile(unittest.TestCase):
+    """ read_signal_file counts mode against list mode and read_signal_files """
+
+    rows = ['p1,d1,1,,true,0.9,true,0.8',
+            'p1,d1,2,,false,0.2,false,0.1',
+            'p1,d1,3,V22_19,,,,',
+            # short row, no improved_f2f_value at all
+            'p1,d2,1,,true,0.7,true',
+            'p1,d2,2,,false,0.3,false,',
+            'p1,d2,3,,true,0.6,true,oops']
+
+    def test_counts_short_row(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            signal_file = os.path.join(tmp, 'signals.csv')
+            with open(signal_file, 'w') as f:
+                f.write('\n'.join(self.rows) + '\n')
+            lists = read_signal_file(signal_file)
+            counts = read_signal_file(signal_file, counts=True)
+            frames = read_signal_files(signal_file, counts=True, processes=1)
+        self.assertEqual(counts['d2'], DocF2FCounts(3, 2, 2.0))
+        self.assertEqual(counts['d1'], DocF2FCounts(2, 1, 0.9, {'V22_19'}))
+        self.assertEqual(frames, counts)
+        for uuid, doc_signals in lists.items():
+            self.assertEqual(counts[uuid].pages, len(doc_signals.f2f))
+            self.assertEqual(counts[uuid].f2f_pages, sum(doc_signals.f2f))
+
+
+class TestRefJsonToCsv(unittest.TestCase):
+    """ ref_json_to_csv names its output from the first usable source """
+
+    def _write_ref_dump(self, tmp, sigs):
+        ref_file = os.path.join(tmp, 'ref.json')
+        ref_sigs = [dict(sig, source=['PageSource', sig['source']],
+                         generator=['DictionaryGenerator', sig['generator']]) for sig in sigs]
+        with open(ref_file, 'w') as dump:
+            json.dump({'signals': ['Signal', ref_sigs]}, dump)
+        return ref_file
+
+    def test_name_from_first_usable_source(self):
+        import contextlib
+        import io
+        import tempfile
+        sigs = [_synthetic_smas_signal(i) for i in range(5)]
+        sigs[2]['source'] = {'startPage': 1, 'endPage': 2, 'documentId': {'uuid': 'd-1'},
+                             'patientId': {'uuid': 'p-1'}}
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+            ref_file = self._write_ref_dump(tmp, sigs)
+            csv_file = ref_json_to_csv(ref_file, lambda base, ext='', **kw: _make_filename(base, ext, tmp))
+            self.assertEqual(os.path.basename(csv_file), 'p-1:d-1-ref.csv')
+            with open(csv_file, newline='') as f:
+                self.assertEqual(sum(1 for _ in csv.reader(f)), len(sigs) + 1)
+
+    def test_no_usable_source(self):
+        import contextlib
+        import io
+        import tempfile
+        from unittest import mock
+        sigs = [_synthetic_smas_signal(i) for i in range(20)]
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()), \
+                mock.patch(f'{__name__}._ref_source_lookahead', 5):
+            ref_file = self._write_ref_dump(tmp, sigs)
+            with self.assertRaisesRegex(ValueError, 'first 5 signals'):
+                ref_json_to_csv(ref_file, lambda base, ext='', **kw: _make_filename(base, ext, tmp))
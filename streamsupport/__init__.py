@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+streaming helpers shared by signal, hcc and apxapisupport: reading json a value
+at a time out of files and response bodies too big to load whole, and asking
+the dataorchestrator for bodies we can stream. stdlib only, so importing this
+doesn't drag in pandas or apxapi
+"""
+import json
+import re
+
+__version__ = "0.1.0"
+__all__ = ['JsonStream', 'ResponseText', 'fetch_streaming']
+
+
+_read_chunk_size = 1 << 20
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+class JsonStream(object):
+    '''
+    incremental reader for big json files. we keep a window of text from the file
+    and hand it to the stdlib raw_decode one value at a time, pulling more of the
+    file in when a value runs off the end of the window. text we have already
+    decoded is dropped, so memory is bounded by the largest single value (one
+    signal, one patient's claims) and not by the size of the file
+
+    fp - anything with a text read(size), an open file or a ResponseText
+
+    track_offsets - keep count of the utf-8 byte offset of the window so offset()
+      can say where each value starts in the file
+    '''
+    def __init__(self, fp, chunk_size=_read_chunk_size, track_offsets=False):
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+        self._track_offsets = track_offsets
+        # byte offset of self._buf[self._mark], each stretch of text is only encoded once
+        self._mark = 0
+        self._mark_offset = 0
+
+    def _fill(self):
+        # read at least as much as we are holding so a huge value costs log(n) retries
+        chunk = self._fp.read(max(self._chunk_size, len(self._buf) - self._pos))
+        if not chunk:
+            self._eof = True
+            return False
+        if self._track_offsets:
+            self._mark_offset += len(self._buf[self._mark:self._pos].encode('utf-8'))
+            self._mark = 0
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self):
+        ''' next non whitespace char, '' at end of file '''
+        while True:
+            self._pos = _whitespace.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def offset(self):
+        ''' byte offset of the next value in the file, None unless track_offsets '''
+        if not self._track_offsets:
+            return None
+        self.peek()
+        self._mark_offset += len(self._buf[self._mark:self._pos].encode('utf-8'))
+        self._mark = self._pos
+        return self._mark_offset
+
+    def expect(self, ch):
+        found = self.peek()
+        if found != ch:
+            raise ValueError(f"bad json, expected '{ch}' got '{found}'")
+        self._pos += 1
+
+    def value(self):
+        ''' decode the next complete json value '''
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number sitting at the end of the window may have been cut in half
+            if end == len(self._buf) and self._fill():
+                continue
+            self._pos = end
+            return obj
+
+    def array_items(self):
+        '''
+        walk an array, yields once per element and the caller must consume
+        the element (value() or a nested array_items()) before asking for the next
+        '''
+        self.expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield
+            found = self.peek()
+            self._pos += 1
+            if found == ']':
+                return
+            if found != ',':
+                raise ValueError(f"bad json, expected ',' or ']' got '{found}'")
+
+    def object_keys(self):
+        ''' walk an object, yields each key and the caller must consume the value '''
+        self.expect('{')
+        if self.peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            found = self.peek()
+            self._pos += 1
+            if found == '}':
+                return
+            if found != ',':
+                raise ValueError(f"bad json, expected ',' or '}}' got '{found}'")
+
+
+class ResponseText(object):
+    ''' file like read() of a requests response body as text, a chunk at a time, for JsonStream '''
+    def __init__(self, response, chunk_size=1 << 20):
+        import codecs
+        self._chunks = response.iter_content(chunk_size=chunk_size)
+        self._decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')()
+        self._done = False
+
+    def read(self, size=-1):
+        # size is only a hint, a chunk is returned whatever its length
+        while not self._done:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._done = True
+                return self._decoder.decode(b'', final=True)
+            text = self._decoder.decode(chunk)
+            if text:
+                return text
+        return ''
+
+
+# fetch function -> whether it takes the requests stream kwarg, looked up once
+_takes_stream = {}
+
+def _accepts_stream(method) -> bool:
+    import inspect
+
+    func = getattr(method, '__func__', method)
+    if func not in _takes_stream:
+        try:
+            params = inspect.signature(method).parameters.values()
+            _takes_stream[func] = any(p.name == 'stream' or p.kind == p.VAR_KEYWORD for p in params)
+        except (TypeError, ValueError):
+            # no signature to look at (builtins, some C wrappers), try it and let it fail loudly
+            _takes_stream[func] = True
+        if not _takes_stream[func]:
+            print("WARNING: {} does not take stream=, the whole body is read into memory".format(
+                getattr(func, '__qualname__', func)))
+    return _takes_stream[func]
+
+
+def fetch_streaming(method, *args):
+    """
+    call a dataorchestrator fetch asking for the body to be streamed, if this apxapi
+    does not take the requests stream kwarg we get the body in memory as before
+    """
+    if _accepts_stream(method):
+        return method(*args, stream=True)
+    return method(*args)